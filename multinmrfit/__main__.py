@@ -1,12 +1,14 @@
 from subprocess import run
 from pathlib import Path
+import argparse
+import sys
 import multinmrfit
 from threading import Thread
-import requests
 
 def get_last_version():
     """Get last multinmrfit version."""
     try:
+        import requests
         pf_path = Path(multinmrfit.__file__).parent
         # Get the version from pypi
         response = requests.get('https://pypi.org/pypi/multinmrfit/json')
@@ -17,7 +19,22 @@ def get_last_version():
         pass
 
 
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(prog="nmrfit",
+                                     description="MultiNMRFit: automated analysis of NMR spectra. Starts the graphical user interface if no command is given.")
+    subparsers = parser.add_subparsers(dest="command")
+    batch_parser = subparsers.add_parser("batch", help="process a series of spectra without the graphical user interface")
+    batch_parser.add_argument("config", help="configuration file (json)")
+    batch_parser.add_argument("-w", "--workers", type=int, default=None, help="number of worker processes (default: number of processors)")
+    batch_parser.add_argument("-p", "--progress", default=None, help="file where progress is logged as json lines (default: standard output)")
+    return parser.parse_args(args)
+
+
 def main():
+    args = parse_args()
+    if args.command == "batch":
+        from multinmrfit.base import batch
+        sys.exit(batch.main(args.config, workers=args.workers, progress_file=args.progress))
     thread = Thread(target=get_last_version)
     thread.start()
     path_to_app = Path(multinmrfit.__file__).parent
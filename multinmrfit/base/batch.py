@@ -0,0 +1,195 @@
+"""
+multinmrfit batch module, to process a series of spectra without the graphical user interface
+"""
+
+import json
+import logging
+import sys
+import time
+import pandas as pd
+from multinmrfit.base.process import Process
+
+
+# create logger
+logger = logging.getLogger(__name__)
+
+
+def load_config(config_file):
+    """Load batch configuration file.
+
+    Args:
+        config_file (str): path to the configuration file (json).
+
+    Returns:
+        dict: configuration
+    """
+
+    with open(config_file, "r") as f:
+        config = json.load(f)
+
+    # check configuration
+    for key in ["analysis_type", "output_res_path", "output_res_folder", "output_filename", "regions"]:
+        if key not in config:
+            raise ValueError(f"Key '{key}' is missing in configuration file '{config_file}'.")
+    if config["analysis_type"] in ["pseudo2D", "list of 1Ds"]:
+        for key in ["data_path", "dataset", "expno", "procno"]:
+            if key not in config:
+                raise ValueError(f"Key '{key}' is required in configuration file for analysis type '{config['analysis_type']}'.")
+    elif config["analysis_type"] == "txt data":
+        if "txt_data" not in config:
+            raise ValueError("Key 'txt_data' is required in configuration file for analysis type 'txt data'.")
+    for region in config["regions"]:
+        for key in ["window", "signals"]:
+            if key not in region:
+                raise ValueError(f"Key '{key}' is missing in region {region}.")
+
+    return config
+
+
+def _log_progress(stream, t0, event, **kwargs):
+    """Write an event as a json line.
+
+    Args:
+        stream (file): stream where events are written.
+        t0 (float): starting time of the batch.
+        event (str): event type.
+    """
+
+    stream.write(json.dumps({"time": round(time.time() - t0, 3), "event": event, **kwargs}, default=str) + "\n")
+    stream.flush()
+
+
+def run(config, workers=None, progress=sys.stdout):
+    """Process a series of spectra: load data, fit all regions of the reference spectrum, fit the series
+    of spectra from the reference, and export results.
+
+    Args:
+        config (dict): configuration, see load_config().
+        workers (int, optional): number of worker processes (overrides config), number of processors of the machine if None. Defaults to None.
+        progress (file, optional): stream where progress is logged as json lines. Defaults to sys.stdout.
+
+    Returns:
+        Process: process
+    """
+
+    t0 = time.time()
+    workers = config.get("workers", None) if workers is None else workers
+
+    # load data
+    analysis_type = config["analysis_type"]
+    dataset = {
+        "analysis_type": analysis_type,
+        "data_path": str(config["data_path"]) if analysis_type in ['pseudo2D', 'list of 1Ds'] else None,
+        "dataset": str(config["dataset"]) if analysis_type in ['pseudo2D', 'list of 1Ds'] else None,
+        "expno": str(config["expno"]) if analysis_type in ['pseudo2D', 'list of 1Ds'] else None,
+        "procno": str(config["procno"]) if analysis_type in ['pseudo2D', 'list of 1Ds'] else None,
+        "output_res_path": config["output_res_path"],
+        "output_res_folder": config["output_res_folder"],
+        "output_filename": config["output_filename"],
+        "txt_data": pd.read_csv(config["txt_data"], sep="\t") if analysis_type == 'txt data' else None
+    }
+    if config.get("reference", None) is not None:
+        dataset["rowno"] = config["reference"]
+    process = Process(dataset)
+    ref = process.current_spectrum.rowno
+    _log_progress(progress, t0, "data_loaded", n_spectra=len(process.names))
+
+    # fit reference spectrum
+    method = config.get("method", "L-BFGS-B")
+    regions = []
+    for region in config["regions"]:
+        process.set_current_spectrum(ref, window=tuple(region["window"]))
+        process.current_spectrum.build_model(signals=region["signals"],
+                                             available_models=process.models,
+                                             offset=region.get("offset", None))
+        for signal_id, pars in region.get("cnstr_wd", {}).items():
+            for par, values in pars.items():
+                mask = (process.current_spectrum.cnstr_wd["signal_id"] == signal_id) & (process.current_spectrum.cnstr_wd["par"] == par)
+                for k, v in values.items():
+                    process.current_spectrum.cnstr_wd.loc[mask, k] = v
+        process.current_spectrum.fit(method=method)
+        process.add_region()
+        regions.append(process.current_spectrum.region)
+        _log_progress(progress, t0, "reference_fitted", rowno=ref, region=process.current_spectrum.region)
+
+    # save each fitted spectrum as soon as it has been fitted, and restore spectra fitted before an interruption
+    resume = config.get("resume", False)
+    journal_file = process.open_journal(config.get("journal_file", None), resume=resume)
+    try:
+        if resume and journal_file.exists():
+            restored = process.load_journal(journal_file)
+            _log_progress(progress, t0, "journal_loaded", n_spectra=len(restored))
+
+        # fit series
+        jobs = []
+        for region in regions:
+            jobs += [(rowno, region) for rowno in process.build_spectra_list(config.get("spectra", "-".join([str(process.names[0]), str(process.names[-1])])),
+                                                                             ref=ref, region=region, reprocess=True)]
+        use_previous = config.get("use_previous", True)
+        cnstr_wd = {region: process.results[ref][region].cnstr_wd for region in regions} if config.get("adapt_cnstr_wd", False) else None
+
+        n_done = []
+
+        def callback(rowno, previous):
+            n_done.append(rowno)
+            _log_progress(progress, t0, "spectrum_fitted", rowno=rowno, ref=previous, done=len(n_done), total=len(jobs))
+
+        if config.get("global_fit", False):
+            for region in regions:
+                rownos = [rowno for rowno, r in jobs if r == region]
+                res = process.fit_global(rownos, region, ref,
+                                         shared=config.get("shared", None),
+                                         update_pars_from_previous=use_previous,
+                                         update_cnstr_wd=None if cnstr_wd is None else cnstr_wd[region],
+                                         resume=resume)
+                n_done += rownos
+                if res is not None:
+                    _log_progress(progress, t0, "region_fitted", region=region, n_spectra=len(rownos), nfev=res.nfev, status=res.status)
+        else:
+            jumps = process.fit_regions(jobs, ref,
+                                        update_pars_from_previous=use_previous,
+                                        update_cnstr_wd=cnstr_wd,
+                                        method=method,
+                                        workers=workers,
+                                        callback=callback,
+                                        segments=config.get("segments", 1),
+                                        chained=not config.get("fit_from_same_ref", False),
+                                        resume=resume)
+            for _, jump in jumps.iterrows():
+                _log_progress(progress, t0, "segment_boundary", **jump.to_dict())
+    finally:
+        process.close_journal()
+
+    # export results
+    process.save_process_to_file()
+    process.consolidate_results()
+    process.save_consolidated_results()
+    _log_progress(progress, t0, "done", n_fitted=len(n_done))
+
+    return process
+
+
+def main(config_file, workers=None, progress_file=None):
+    """Run batch processing from the command line.
+
+    Args:
+        config_file (str): path to the configuration file (json).
+        workers (int, optional): number of worker processes. Defaults to None.
+        progress_file (str, optional): file where progress is logged, standard output if None. Defaults to None.
+
+    Returns:
+        int: exit status
+    """
+
+    progress = sys.stdout if progress_file is None else open(progress_file, "w")
+    t0 = time.time()
+    try:
+        run(load_config(config_file), workers=workers, progress=progress)
+        return 0
+    except Exception as e:
+        logger.exception("batch processing failed")
+        _log_progress(progress, t0, "error", message=str(e))
+        return 1
+    finally:
+        if progress_file is not None:
+            progress.close()
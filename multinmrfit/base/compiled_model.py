@@ -0,0 +1,222 @@
+"""
+multinmrfit compiled model module
+"""
+
+import logging
+import numpy as np
+
+
+# create logger
+logger = logging.getLogger(__name__)
+
+# maximal number of elements of intermediate (n_spectra x n_peaks x n_points) arrays when simulating several spectra at once
+MAX_BATCH_SIZE = 200000
+
+
+class CompiledModel(object):
+    """This class gathers the models of all signals of a spectrum in a flat representation, to simulate
+    the spectrum (and its partial derivatives) from the global parameters vector in a single vectorized
+    operation over all peaks.
+
+    Models which describe their multiplet structure (i.e. mixed gaussian-lorentzian multiplets) are
+    flattened into arrays of peaks, while other models are simulated individually. This is the only
+    implementation of mixed gaussian-lorentzian multiplets, models alone are simulated by compiling them.
+    """
+
+    def __init__(self, models: dict, n_params: int, offset: bool = False, par_idx: dict = None) -> None:
+        """Construct the CompiledModel object.
+
+        Args:
+            models (dict): models of all signals
+            n_params (int): number of parameters
+            offset (bool, optional): offset (provided as last element of params) added to spectrum if True. Defaults to False.
+            par_idx (dict, optional): indices of the parameters of each model in the parameters vector (with the same keys as models),
+                                      indices of the models (model._par_idx) are used if None. Defaults to None.
+        """
+
+        logger.debug("compile model")
+
+        self.n_params = n_params
+        self.offset = offset
+
+        # models simulated individually
+        self.other_models = []
+
+        # coefficients of each parameter in the chemical shift of each peak
+        shift_coef = []
+        # indices of intensity, linewidth and gaussian-lorentzian ratio of each peak
+        intensity_idx, lw_idx, gl_idx = [], [], []
+        # relative intensities of the lorentzian and gaussian contributions of each peak
+        w_l, w_g = [], []
+
+        for name, model in models.items():
+
+            model_idx = model._par_idx if par_idx is None else par_idx[name]
+            multiplet = getattr(model, "multiplet", None)
+
+            if multiplet is None:
+                self.other_models.append((model, model_idx))
+                continue
+
+            idx = dict(zip(model.default_params['par'], model_idx))
+            n_peaks = len(multiplet['w_l'])
+
+            coef = np.zeros((n_peaks, n_params))
+            coef[:, idx['x0']] = 1.0
+            for k, c in multiplet.get('coupling', {}).items():
+                coef[:, idx[k]] = c
+            shift_coef.append(coef)
+
+            intensity_idx += [idx['intensity']] * n_peaks
+            lw_idx += [idx['lw']] * n_peaks
+            gl_idx += [idx['gl']] * n_peaks
+            w_l += list(multiplet['w_l'])
+            w_g += list(multiplet['w_g'])
+
+        self.n_peaks = len(intensity_idx)
+        self.shift_coef = np.vstack(shift_coef) if self.n_peaks else np.zeros((0, n_params))
+        self.intensity_idx = np.array(intensity_idx, dtype=int)
+        self.lw_idx = np.array(lw_idx, dtype=int)
+        self.gl_idx = np.array(gl_idx, dtype=int)
+        self.w_l = np.array(w_l, dtype=float)
+        self.w_g = np.array(w_g, dtype=float)
+
+        # matrix mapping the partial derivatives of each peak (with respect to its chemical shift, intensity,
+        # linewidth and gaussian-lorentzian ratio) to the global parameters
+        self.derivatives_map = np.vstack([self.shift_coef,
+                                          self._one_hot(self.intensity_idx, n_params),
+                                          self._one_hot(self.lw_idx, n_params),
+                                          self._one_hot(self.gl_idx, n_params)])
+
+    @staticmethod
+    def _one_hot(idx: np.ndarray, n_params: int) -> np.ndarray:
+
+        one_hot = np.zeros((len(idx), n_params))
+        one_hot[np.arange(len(idx)), idx] = 1.0
+
+        return one_hot
+
+    def _peaks(self, params: np.ndarray, ppm: np.ndarray) -> tuple:
+        """Calculate lorentzian and gaussian contributions of all peaks.
+
+        Args:
+            params (np.ndarray): parameters values, with shape (n_params,) or (n_spectra, n_params)
+            ppm (np.ndarray): chemical shifts
+
+        Returns:
+            tuple: distance to peak position, lorentzian and gaussian contributions (each with shape (n_peaks, len(ppm)), or
+                   (n_spectra, n_peaks, len(ppm))), and intensity, linewidth and gaussian-lorentzian ratio of each peak
+        """
+
+        shifts = params @ self.shift_coef.T
+        intensity = params[..., self.intensity_idx]
+        lw = params[..., self.lw_idx, None]
+        gl = params[..., self.gl_idx]
+
+        dx = ppm - shifts[..., None]
+        lorentzian = 1 / (1 + (dx/lw)**2)
+        gaussian = np.exp(-dx**2/(2*lw**2))
+
+        return dx, lorentzian, gaussian, intensity, lw, gl
+
+    def simulate(self, params: list, ppm: list) -> np.ndarray:
+        """Simulate spectrum.
+
+        Args:
+            params (list): parameters values, with shape (n_params,), or (n_spectra, n_params) to simulate several spectra at once
+            ppm (list): chemical shifts
+
+        Returns:
+            np.ndarray: simulated intensities, with shape (len(ppm),) or (n_spectra, len(ppm))
+        """
+
+        params = np.asarray(params, dtype=float)
+        ppm = np.asarray(ppm, dtype=float)
+
+        if params.ndim == 2:
+            # simulate spectra by chunks to limit memory usage
+            chunk_size = max(1, MAX_BATCH_SIZE // max(1, self.n_peaks * len(ppm)))
+            simulated_spectra = np.empty((len(params), len(ppm)))
+            for i in range(0, len(params), chunk_size):
+                simulated_spectra[i:i+chunk_size] = self._simulate(params[i:i+chunk_size], ppm)
+            return simulated_spectra
+
+        return self._simulate(params, ppm)
+
+    def _simulate(self, params: np.ndarray, ppm: np.ndarray) -> np.ndarray:
+
+        # initialize spectrum at offset or 0
+        simulated_spectrum = np.zeros(params.shape[:-1] + (len(ppm),))
+        if self.offset:
+            simulated_spectrum += params[..., -1, None]
+
+        # add all peaks of multiplets
+        if self.n_peaks:
+            _, lorentzian, gaussian, intensity, _, gl = self._peaks(params, ppm)
+            simulated_spectrum += np.matmul((intensity * gl * self.w_l)[..., None, :], lorentzian)[..., 0, :]
+            simulated_spectrum += np.matmul((intensity * (1-gl) * self.w_g)[..., None, :], gaussian)[..., 0, :]
+
+        # add subspectrum of other signals
+        for model, idx in self.other_models:
+            if params.ndim == 2:
+                simulated_spectrum += model.simulate_batch(params[:, idx], ppm)
+            else:
+                simulated_spectrum += model.simulate(params[idx], ppm)
+
+        return simulated_spectrum
+
+    def jacobian(self, params: list, ppm: list) -> np.ndarray:
+        """Calculate partial derivatives of the simulated spectrum with respect to each parameter.
+
+        Args:
+            params (list): parameters values
+            ppm (list): chemical shifts
+
+        Returns:
+            np.ndarray: jacobian matrix, with shape (len(ppm), len(params))
+        """
+
+        params = np.asarray(params, dtype=float)
+        ppm = np.asarray(ppm, dtype=float)
+
+        jacobian = np.zeros((len(ppm), self.n_params))
+
+        # add derivatives of all peaks of multiplets (with respect to their chemical shift, intensity,
+        # linewidth and gaussian-lorentzian ratio)
+        if self.n_peaks:
+            dx, lorentzian, gaussian, intensity, lw, gl = self._peaks(params, ppm)
+            derivatives = np.empty((4, self.n_peaks, len(ppm)))
+            d_shifts, d_intensity, d_lw, d_gl = derivatives
+            lorentzian_w = (gl * self.w_l)[:, None] * lorentzian
+            gaussian_w = ((1-gl) * self.w_g)[:, None] * gaussian
+            np.add(lorentzian_w, gaussian_w, out=d_intensity)
+            np.multiply((intensity / lw[:, 0]**2)[:, None] * dx, 2 * lorentzian * lorentzian_w + gaussian_w, out=d_shifts)
+            np.multiply(d_shifts, dx / lw, out=d_lw)
+            np.subtract((intensity * self.w_l)[:, None] * lorentzian, (intensity * self.w_g)[:, None] * gaussian, out=d_gl)
+            jacobian += (self.derivatives_map.T @ derivatives.reshape(-1, len(ppm))).T
+
+        # add derivatives of other signals
+        for model, idx in self.other_models:
+            jacobian[:, idx] += model.gradient(params[idx], ppm).T
+
+        # add derivative with respect to offset
+        if self.offset:
+            jacobian[:, -1] = 1.0
+
+        return jacobian
+
+    def integrals(self, params: list) -> np.ndarray:
+        """Calculate analytically the integral (from -inf to +inf) of each peak of multiplets.
+
+        Args:
+            params (list): parameters values
+
+        Returns:
+            np.ndarray: integral of each peak
+        """
+
+        params = np.asarray(params, dtype=float)
+        intensity, lw, gl = params[self.intensity_idx], params[self.lw_idx], params[self.gl_idx]
+
+        # area of a lorentzian peak is pi*lw*intensity, area of a gaussian peak is sqrt(2*pi)*lw*intensity
+        return intensity * lw * (gl * np.pi * self.w_l + (1-gl) * np.sqrt(2*np.pi) * self.w_g)
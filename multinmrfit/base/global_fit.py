@@ -0,0 +1,202 @@
+"""
+multinmrfit global fit module
+"""
+
+import logging
+import numpy as np
+from scipy.optimize import least_squares, OptimizeResult
+from scipy.sparse import csr_matrix
+
+from multinmrfit.base.spectrum import Spectrum
+
+
+# create logger
+logger = logging.getLogger(__name__)
+
+
+class GlobalFit(object):
+    """This class fits jointly a region of several spectra (e.g. all rows of a pseudo 2D spectrum), some parameters
+    (e.g. coupling constants or linewidths) being shared by all spectra while the others are estimated for each spectrum.
+
+    The jacobian of the residuals is block-sparse (each spectrum only depends on its own parameters and on the shared
+    parameters), so the problem is solved with a trust region reflective algorithm using a sparse iterative solver,
+    and standard deviations are calculated block by block, without building the dense covariance matrix.
+    """
+
+    def __init__(self, spectra: list, shared: list = None) -> None:
+        """Construct the GlobalFit object.
+
+        Args:
+            spectra (list): spectra to fit, with the same model and parameters (initial values and bounds) already set.
+            shared (list, optional): shared parameters, as parameters names (e.g. 'J', shared for all signals) or
+                                     tuples (signal_id, par). Defaults to None.
+        """
+
+        logger.debug("initialize global fit")
+
+        if not len(spectra):
+            raise ValueError("At least one spectrum is required for global fit.")
+
+        self.spectra = spectra
+        self.compiled_model = spectra[0]._get_compiled_model()
+        params = spectra[0].params
+        self.n_spectra = len(spectra)
+        self.n_params = len(params)
+
+        if any(len(sp.params) != self.n_params for sp in spectra):
+            raise ValueError("All spectra must have the same model for global fit.")
+
+        # shared parameters
+        shared = [] if shared is None else shared
+        self.shared = np.array([(par in shared) or ((signal_id, par) in shared) for signal_id, par in zip(params['signal_id'], params['par'])], dtype=bool)
+        self.n_shared = int(np.sum(self.shared))
+        self.n_local = self.n_params - self.n_shared
+
+        # position of the parameters of each spectrum in the global vector of parameters (shared parameters first)
+        self.idx = np.empty((self.n_spectra, self.n_params), dtype=int)
+        self.idx[:, self.shared] = np.arange(self.n_shared)
+        self.idx[:, ~self.shared] = self.n_shared + np.arange(self.n_spectra * self.n_local).reshape(self.n_spectra, self.n_local)
+        self.n_global = self.n_shared + self.n_spectra * self.n_local
+
+        # scaling factor, common to all spectra since parameters may be shared
+        max_sp = max(np.max(sp.intensity) for sp in spectra)
+        self.scaling_factor = 1 if -1 < max_sp < 1 else abs(max_sp)
+        self.scaled = params['par'].isin(["intensity", "offset"]).values
+
+        # data
+        self.ppm = [np.asarray(sp.ppm, dtype=float) for sp in spectra]
+        self.data = [np.asarray(sp.intensity, dtype=float) / self.scaling_factor for sp in spectra]
+        self.rows = np.cumsum([0] + [len(ppm) for ppm in self.ppm])
+        self.same_ppm = all(np.array_equal(ppm, self.ppm[0]) for ppm in self.ppm)
+        if self.same_ppm:
+            self.data = np.vstack(self.data)
+
+        # sparsity structure of the jacobian (columns sorted in the same order for each spectrum)
+        self._order = np.argsort(self.idx[0])
+        self._indices = np.concatenate([np.tile(self.idx[i, self._order], len(ppm)) for i, ppm in enumerate(self.ppm)])
+        self._indptr = np.arange(0, self.rows[-1] * self.n_params + 1, self.n_params)
+
+    def _to_global(self, values: np.ndarray) -> np.ndarray:
+        """Build the global vector of parameters from the parameters of each spectrum (values of shared parameters
+        are taken from the first spectrum).
+
+        Args:
+            values (np.ndarray): values of the parameters of each spectrum, with shape (n_spectra, n_params)
+
+        Returns:
+            np.ndarray: global vector of parameters
+        """
+
+        theta = np.empty(self.n_global)
+        theta[self.idx[::-1]] = values[::-1]
+
+        return theta
+
+    def residuals(self, theta: np.ndarray) -> np.ndarray:
+        """Calculate residuals of all spectra.
+
+        Args:
+            theta (np.ndarray): global vector of parameters
+
+        Returns:
+            np.ndarray: residuals
+        """
+
+        params = theta[self.idx]
+
+        if self.same_ppm:
+            return (self.compiled_model.simulate(params, self.ppm[0]) - self.data).ravel()
+
+        return np.concatenate([self.compiled_model.simulate(params[i], ppm) - self.data[i] for i, ppm in enumerate(self.ppm)])
+
+    def _jacobian_blocks(self, theta: np.ndarray) -> list:
+
+        params = theta[self.idx]
+
+        return [self.compiled_model.jacobian(params[i], ppm) for i, ppm in enumerate(self.ppm)]
+
+    def jacobian(self, theta: np.ndarray) -> csr_matrix:
+        """Calculate the (sparse) jacobian of residuals.
+
+        Args:
+            theta (np.ndarray): global vector of parameters
+
+        Returns:
+            scipy.sparse.csr_matrix: jacobian, with shape (number of residuals, n_global)
+        """
+
+        data = np.concatenate([block[:, self._order].ravel() for block in self._jacobian_blocks(theta)])
+
+        return csr_matrix((data, self._indices, self._indptr), shape=(self.rows[-1], self.n_global))
+
+    def _standard_deviations(self, res: OptimizeResult) -> np.ndarray:
+        """Calculate standard deviations on the global vector of parameters using linear statistics. The normal matrix
+        is inverted by blocks (Schur complement of the block-diagonal part of the spectra specific parameters).
+
+        Args:
+            res (scipy.optimize.OptimizeResult): optimization results
+
+        Returns:
+            np.ndarray: standard deviations
+        """
+
+        dof = max(1, len(res.fun) - self.n_global)
+        variance = np.sum(np.square(res.fun)) / dof
+
+        local, shared = ~self.shared, self.shared
+        a_inv, b, schur = [], [], np.zeros((self.n_shared, self.n_shared))
+        for block in self._jacobian_blocks(res.x):
+            j_local, j_shared = block[:, local], block[:, shared]
+            a_inv.append(np.linalg.pinv(j_local.T @ j_local))
+            b.append(j_local.T @ j_shared)
+            schur += j_shared.T @ j_shared - b[-1].T @ a_inv[-1] @ b[-1]
+        schur_inv = np.linalg.pinv(schur) if self.n_shared else schur
+
+        diag = np.empty(self.n_global)
+        diag[:self.n_shared] = np.diag(schur_inv)
+        for i in range(self.n_spectra):
+            c = a_inv[i] @ b[i]
+            diag[self.idx[i, local]] = np.diag(a_inv[i]) + np.einsum('ij,jk,ik->i', c, schur_inv, c)
+
+        return np.sqrt(np.abs(diag) * variance)
+
+    def fit(self) -> OptimizeResult:
+        """Fit all spectra jointly, and save results in each spectrum.
+
+        Returns:
+            scipy.optimize.OptimizeResult: optimization results
+        """
+
+        logger.debug("global fit of {} spectra ({} parameters)".format(self.n_spectra, self.n_global))
+
+        for sp in self.spectra:
+            sp._check_parameters()
+
+        # initial values & bounds of scaled parameters
+        values = {}
+        for k in ["ini", "lb", "ub"]:
+            values[k] = np.array([sp.params[k].values for sp in self.spectra], dtype=float)
+            values[k][:, self.scaled] /= self.scaling_factor
+        x0 = self._to_global(values["ini"])
+        lb, ub = Spectrum._strict_bounds(self._to_global(values["lb"]), self._to_global(values["ub"]))
+
+        res = least_squares(
+            self.residuals,
+            x0=np.clip(x0, lb, ub),
+            jac=self.jacobian,
+            bounds=(lb, ub),
+            method="trf",
+            tr_solver="lsmr",
+            x_scale="jac"
+        )
+
+        standard_deviations = self._standard_deviations(res)
+
+        # save results of each spectrum
+        for i, sp in enumerate(self.spectra):
+            fun = res.fun[self.rows[i]:self.rows[i+1]]
+            sp_res = OptimizeResult(x=res.x[self.idx[i]], fun=fun, cost=0.5*np.sum(np.square(fun)), success=res.success, status=res.status,
+                                    message=res.message, nfev=res.nfev, njev=res.njev, shared=self.shared.copy())
+            sp._set_fit_results(sp_res, standard_deviations[self.idx[i]], self.scaling_factor)
+
+        return res
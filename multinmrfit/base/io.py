@@ -1,9 +1,13 @@
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import nmrglue as ng
 import numpy as np
 import importlib
+import hashlib
+import json
 import os
+import shutil
 import multinmrfit
 import logging
 
@@ -11,6 +15,245 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+class Bruker2DData(object):
+    """Processed data of a pseudo 2D Bruker dataset (e.g. 2rr file), memory-mapped from the binary file.
+
+    The binary file is stored as submatrices (tiles of XDIM points in each dimension), each row is reordered
+    and scaled only when it is accessed, so memory usage is bounded by the rows being processed. Rows are
+    accessed as with a numpy array (data[i], data[i:j], data[[i, j]]), and np.asarray(data) reads the full dataset.
+    """
+
+    def __init__(self, filename, shape: tuple, submatrix_shape: tuple, big: bool = False, isfloat: bool = False, scale: float = 1.0, rows: list = None) -> None:
+        """Construct the Bruker2DData object.
+
+        Args:
+            filename (str): path to the binary file.
+            shape (tuple): shape of the data (SI of each dimension).
+            submatrix_shape (tuple): shape of the submatrices (XDIM of each dimension).
+            big (bool, optional): big-endian binary file. Defaults to False.
+            isfloat (bool, optional): float64 binary file (int32 otherwise). Defaults to False.
+            scale (float, optional): scaling factor of intensities. Defaults to 1.0.
+            rows (list, optional): rows of the binary file to keep, all rows if None. Defaults to None.
+        """
+
+        self.filename = str(filename)
+        self.file_shape = tuple(int(i) for i in shape)
+        self.submatrix_shape = tuple(int(i) for i in submatrix_shape)
+        self.big = big
+        self.isfloat = isfloat
+        self.scale = scale
+        self.rows = np.arange(self.file_shape[0]) if rows is None else np.asarray(rows, dtype=int)
+        self._tiles = None
+
+        if any(i % j for i, j in zip(self.file_shape, self.submatrix_shape)):
+            raise ValueError(f"Data shape {self.file_shape} is not a multiple of submatrix shape {self.submatrix_shape}.")
+        if os.path.getsize(self.filename) < np.prod(self.file_shape) * (8 if isfloat else 4):
+            raise ValueError(f"File '{self.filename}' is smaller than expected from data shape {self.file_shape}.")
+
+    @classmethod
+    def from_pdata(cls, full_path):
+        """Build the object from a Bruker pdata folder, using processing parameters (procs & proc2s files).
+
+        Args:
+            full_path (str): path to the pdata folder.
+
+        Returns:
+            tuple: procs dictionary, data
+        """
+
+        dic = ng.bruker.read_procs_file(str(full_path))
+        shape, submatrix_shape = ng.bruker.guess_shape_and_submatrix_shape(dic)
+        if shape is None or len(shape) != 2:
+            raise ValueError(f"Unable to determine the shape of 2D data in '{full_path}'.")
+        scale = np.power(2., float(dic['procs'].get('NC_proc', 0)))
+
+        return dic, cls(Path(full_path, "2rr"), shape, submatrix_shape,
+                        big=dic['procs'].get('BYTORDP', 0) == 1, isfloat=dic['procs'].get('DTYPP', 0) == 2, scale=scale)
+
+    def __getstate__(self):
+        # the memory map is reopened when needed
+        state = self.__dict__.copy()
+        state["_tiles"] = None
+        return state
+
+    @property
+    def tiles(self) -> np.ndarray:
+        """Memory-mapped binary file, with shape (n_submatrices_1, n_submatrices_0, xdim_1, xdim_0)."""
+
+        if self._tiles is None:
+            dtype = np.dtype(("f8" if self.isfloat else "i4")).newbyteorder(">" if self.big else "<")
+            raw = np.memmap(self.filename, dtype=dtype, mode="r", shape=(int(np.prod(self.file_shape)),))
+            (si_1, si_0), (xdim_1, xdim_0) = self.file_shape, self.submatrix_shape
+            self._tiles = raw.reshape(si_1 // xdim_1, si_0 // xdim_0, xdim_1, xdim_0)
+        return self._tiles
+
+    @property
+    def shape(self) -> tuple:
+        return (len(self.rows), self.file_shape[1])
+
+    @property
+    def ndim(self) -> int:
+        return 2
+
+    @property
+    def dtype(self):
+        return np.dtype(float)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def _read_rows(self, rows: np.ndarray) -> np.ndarray:
+        """Read, reorder and scale rows of the binary file.
+
+        Args:
+            rows (np.ndarray): rows of the binary file.
+
+        Returns:
+            np.ndarray: intensities, with shape (len(rows), si_0)
+        """
+
+        xdim_1 = self.submatrix_shape[0]
+        data = self.tiles[rows // xdim_1, :, rows % xdim_1, :]
+
+        return data.reshape(len(rows), self.file_shape[1]).astype(float) * self.scale
+
+    def __getitem__(self, key):
+        key = key if isinstance(key, tuple) else (key,)
+        rows = self.rows[key[0]]
+        if np.ndim(rows) == 0:
+            data = self._read_rows(np.atleast_1d(rows))[0]
+            return data[key[1:]]
+        return self._read_rows(rows)[(slice(None),) + key[1:]]
+
+    def __array__(self, dtype=None, copy=None):
+        data = self._read_rows(self.rows)
+        return data if dtype is None else data.astype(dtype)
+
+    def select_rows(self, mask):
+        """Select rows, without reading data.
+
+        Args:
+            mask (list): rows to keep (boolean mask or indices).
+
+        Returns:
+            Bruker2DData: data of the selected rows
+        """
+
+        return Bruker2DData(self.filename, self.file_shape, self.submatrix_shape, big=self.big, isfloat=self.isfloat,
+                            scale=self.scale, rows=self.rows[mask])
+
+
+class DataCache(object):
+    """On-disk cache of decoded Bruker datasets (chemical shift axes and intensities, saved as .npy files).
+
+    Entries are keyed by the path of the dataset, the expno(s) and procno, and the size and modification time of
+    all processed data files, so any reprocessing in Topspin invalidates the entry. The least recently used entries
+    are removed when the total size of the cache exceeds max_size.
+    """
+
+    def __init__(self, path=None, max_size: int = None) -> None:
+        """Construct the DataCache object.
+
+        Args:
+            path (str, optional): cache folder, environment variable MULTINMRFIT_CACHE_DIR or '~/.cache/multinmrfit' if None. Defaults to None.
+            max_size (int, optional): maximal size of the cache (in bytes), environment variable MULTINMRFIT_CACHE_SIZE or 2 GB if None. Defaults to None.
+        """
+
+        self.path = Path(path if path is not None else os.environ.get("MULTINMRFIT_CACHE_DIR", Path.home() / ".cache" / "multinmrfit"))
+        self.max_size = int(max_size if max_size is not None else os.environ.get("MULTINMRFIT_CACHE_SIZE", 2 * 1024**3))
+
+    @staticmethod
+    def key(pdata_paths: list, *args) -> str:
+        """Build the key of a dataset.
+
+        Args:
+            pdata_paths (list): pdata folders of the dataset.
+            *args: other parameters identifying the dataset (e.g. analysis type).
+
+        Returns:
+            str: key
+        """
+
+        items = [str(i) for i in args]
+        for pdata_path in pdata_paths:
+            items.append(str(Path(pdata_path).resolve()))
+            for f in sorted(Path(pdata_path).iterdir()):
+                if f.is_file():
+                    stat = f.stat()
+                    items.append(f"{f.name}:{stat.st_size}:{stat.st_mtime_ns}")
+
+        return hashlib.sha1("\n".join(items).encode()).hexdigest()
+
+    def get(self, key: str):
+        """Get a dataset from the cache. Intensities are memory-mapped.
+
+        Args:
+            key (str): key of the dataset.
+
+        Returns:
+            tuple: (ppm, data, names), None if the dataset is not in the cache
+        """
+
+        entry = Path(self.path, key)
+        try:
+            ppm = np.load(Path(entry, "ppm.npy"))
+            data = np.load(Path(entry, "data.npy"), mmap_mode="r")
+            with open(Path(entry, "names.json"), "r") as f:
+                names = json.load(f)
+            # mark entry as recently used
+            os.utime(entry)
+        except (OSError, ValueError):
+            return None
+
+        logger.debug("dataset loaded from cache '{}'".format(entry))
+
+        return ppm, data, names
+
+    def put(self, key: str, ppm: np.ndarray, data: np.ndarray, names: list) -> None:
+        """Save a dataset in the cache, and remove least recently used entries if needed.
+
+        Args:
+            key (str): key of the dataset.
+            ppm (np.ndarray): chemical shift.
+            data (np.ndarray): intensities.
+            names (list): names of spectra.
+        """
+
+        if ppm.nbytes + data.nbytes > self.max_size:
+            return
+
+        entry = Path(self.path, key)
+        tmp_entry = Path(self.path, f"{key}_{os.getpid()}_tmp")
+        try:
+            tmp_entry.mkdir(parents=True, exist_ok=True)
+            np.save(Path(tmp_entry, "ppm.npy"), np.asarray(ppm))
+            np.save(Path(tmp_entry, "data.npy"), np.asarray(data))
+            with open(Path(tmp_entry, "names.json"), "w") as f:
+                json.dump([int(i) for i in names], f)
+            os.replace(tmp_entry, entry)
+        except OSError as e:
+            logger.warning(f"Unable to save dataset in cache ('{e}').")
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+            return
+
+        self.evict()
+
+    def evict(self) -> None:
+        """Remove least recently used entries until the size of the cache is below max_size."""
+
+        entries = []
+        for entry in self.path.iterdir():
+            if entry.is_dir() and not entry.name.endswith("_tmp"):
+                entries.append((entry.stat().st_mtime, sum(f.stat().st_size for f in entry.iterdir()), entry))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries, key=lambda x: x[0]):
+            if total <= self.max_size:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+
 class IoHandler():
 
     def __init__(self):
@@ -72,33 +315,73 @@ class IoHandler():
         # extract ppm and intensities
         udic = ng.bruker.guess_udic(dic, data)
         uc_F = ng.fileiobase.uc_from_udic(udic, ndim-1)
-        ppm = pd.Series(uc_F.ppm_scale())
+        ppm = uc_F.ppm_scale()
         if ndim == 2:
             data = data[int(rowno)]
-        intensity = pd.Series(data)
-
-        # filter selected window
-        if window is not None:
-            mask = (ppm >= window[0]) & (ppm <= window[1])
-            ppm = ppm[mask]
-            intensity = intensity[mask]
 
-        # reset index
-        ppm.reset_index(inplace=True, drop=True)
-        intensity.reset_index(inplace=True, drop=True)
+        # extract selected window (the chemical shift axis is monotonic)
+        window_slice = IoHandler.window_slice(ppm, window)
+        ppm = pd.Series(ppm[window_slice])
+        intensity = pd.Series(data[window_slice])
 
         return ppm, intensity
 
+    @staticmethod
+    def is_monotonic(ppm: np.ndarray) -> bool:
+        """Check if a chemical shift axis is monotonic (increasing or decreasing).
+
+        Args:
+            ppm (np.ndarray): chemical shift.
+
+        Returns:
+            bool: True if the axis is monotonic
+        """
+
+        diff = np.diff(np.asarray(ppm, dtype=float))
+
+        return bool(np.all(diff >= 0) or np.all(diff <= 0))
+
+    @staticmethod
+    def window_slice(ppm: np.ndarray, window: tuple = None) -> slice:
+        """Get the slice of a monotonic (increasing or decreasing) chemical shift axis within a window, by
+        binary search (i.e. without building a mask of the full axis).
+
+        Args:
+            ppm (np.ndarray): chemical shift, must be monotonic.
+            window (tuple, optional): bounds of the window (in any order), full axis if None. Defaults to None.
+
+        Returns:
+            slice: slice of points within the window (bounds included)
+        """
+
+        if window is None:
+            return slice(None)
+
+        ppm = np.asarray(ppm)
+        n = len(ppm)
+        lb, ub = min(window), max(window)
+
+        # increasing axis
+        if n < 2 or ppm[0] <= ppm[-1]:
+            return slice(int(np.searchsorted(ppm, lb, side="left")), int(np.searchsorted(ppm, ub, side="right")))
+
+        # decreasing axis (e.g. Bruker data), searched on a reversed view
+        reverse = ppm[::-1]
+        return slice(n - int(np.searchsorted(reverse, ub, side="right")), n - int(np.searchsorted(reverse, lb, side="left")))
+
     @staticmethod
     def filter_window(ppm: list, intensity: list, window: tuple = None):
 
         # filter selected window
         if window is not None:
-            # mask = (ppm >= window[0]) & (ppm <= window[1])
-            mask = (ppm >= np.min(window)) & (ppm <= np.max(window))
-
-            ppm = ppm[mask]
-            intensity = intensity[mask]
+            if IoHandler.is_monotonic(ppm):
+                window_slice = IoHandler.window_slice(ppm, window)
+                ppm = ppm.iloc[window_slice]
+                intensity = intensity.iloc[window_slice]
+            else:
+                mask = (ppm >= np.min(window)) & (ppm <= np.max(window))
+                ppm = ppm[mask]
+                intensity = intensity[mask]
 
         # reset index
         ppm.reset_index(inplace=True, drop=True)
@@ -106,73 +389,180 @@ class IoHandler():
         return ppm, intensity
 
     @staticmethod
-    def load_1D_spectrum(data_path, dataset, procno, expno_list):
-        ppm_all = []
-        data_all = []
+    def shared_ppm_axis(ppm_all):
+        """Get the chemical shift axis shared by all spectra.
 
-        for exp in expno_list:
+        Args:
+            ppm_all (np.ndarray): chemical shift axis of each spectrum, with shape (n_spectra, n_points).
 
-            # get complete data path
-            full_path = Path(data_path, dataset, str(exp), 'pdata', procno)
+        Returns:
+            np.ndarray: chemical shift axis with shape (1, n_points) if all spectra share the same axis,
+                        chemical shift axis of each spectrum otherwise
+        """
 
-            # read processed data
-            try:
-                dic, data = ng.bruker.read_pdata(str(full_path), read_procs=True, read_acqus=False, scale_data=True, all_components=False)
+        ppm_all = np.atleast_2d(ppm_all)
+        if ppm_all.shape[0] > 1 and np.all(ppm_all == ppm_all[0]):
+            return np.array(ppm_all[:1])
+        return ppm_all
 
-                # extract ppm and intensities
-                udic = ng.bruker.guess_udic(dic, data)
-                uc_F = ng.fileiobase.uc_from_udic(udic, 0)
-                ppm = uc_F.ppm_scale()
-                ppm_all.append(ppm)
-                data_all.append([data][0])
-            except Exception as e:
-                raise ValueError("An unknown error has occurred when opening spectrum: '{}'. Please check your inputs.".format(e))
+    @staticmethod
+    def read_1D_spectrum(data_path, dataset, expno, procno):
+        """Read a processed 1D spectrum.
 
-        try:
-            data = np.array(data_all)
-            ppm_all = np.array(ppm_all)
-        except:
-            raise ValueError("All spectra do not have the same length.")
+        Returns:
+            np.ndarray: chemical shift
+            np.ndarray: intensity
+        """
+
+        # get complete data path
+        full_path = Path(data_path, dataset, str(expno), 'pdata', procno)
+
+        # read processed data
+        dic, data = ng.bruker.read_pdata(str(full_path), read_procs=True, read_acqus=False, scale_data=True, all_components=False)
+
+        # extract ppm and intensities
+        udic = ng.bruker.guess_udic(dic, data)
+        uc_F = ng.fileiobase.uc_from_udic(udic, 0)
 
-        return ppm_all, data, expno_list
+        return uc_F.ppm_scale(), data
+
+    @staticmethod
+    def load_1D_spectrum(data_path, dataset, procno, expno_list, workers=None, cache=None):
+        """Load a list of 1D NMR spectra. Spectra are read concurrently and written in preallocated arrays.
+
+        Args:
+            workers (int, optional): number of threads, default value of ThreadPoolExecutor if None. Defaults to None.
+            cache (DataCache, optional): cache of decoded datasets, not used if None. Defaults to None.
+
+        Returns:
+            np.ndarray: chemical shift (axis shared by all spectra when possible)
+            np.ndarray: intensity
+            list: names of spectra (expno)
+        """
+
+        # get dataset from cache (intensities are memory-mapped)
+        key = None
+        if cache is not None:
+            try:
+                key = cache.key([Path(data_path, dataset, str(exp), 'pdata', procno) for exp in expno_list], "list of 1Ds")
+                cached = cache.get(key)
+            except OSError:
+                key, cached = None, None
+            if cached is not None:
+                return cached
+
+        errors = {}
+        ppm_all, data_all = None, None
+
+        def read(i, exp):
+            try:
+                ppm, data = IoHandler.read_1D_spectrum(data_path, dataset, exp, procno)
+            except Exception as e:
+                errors[exp] = "an unknown error has occurred when opening spectrum: '{}'".format(e)
+                return False
+            if data_all is not None and (np.ndim(data) != 1 or len(data) != data_all.shape[1]):
+                errors[exp] = "spectrum has {} points ({} expected), all spectra must have the same length".format(np.size(data), data_all.shape[1])
+                return False
+            if data_all is not None:
+                ppm_all[i], data_all[i] = ppm, data
+            return ppm, data
+
+        # arrays are allocated from the first spectrum which can be read
+        first = 0
+        while first < len(expno_list) and data_all is None:
+            res = read(first, expno_list[first])
+            if res:
+                ppm_all, data_all = np.empty((len(expno_list), len(res[0]))), np.empty((len(expno_list), len(res[1])))
+                ppm_all[first], data_all[first] = res
+            first += 1
+
+        # read other spectra
+        if data_all is not None:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                list(executor.map(read, range(first, len(expno_list)), expno_list[first:]))
+
+        if len(errors) or data_all is None:
+            details = "\n".join("expno {}: {}".format(exp, errors[exp]) for exp in expno_list if exp in errors)
+            raise ValueError("Unable to load {} spectra, please check your inputs.\n{}".format(len(errors), details))
+
+        # keep a single chemical shift axis if it is shared by all spectra
+        ppm_all = IoHandler.shared_ppm_axis(ppm_all)
+
+        if key is not None:
+            cache.put(key, ppm_all, data_all, expno_list)
+
+        return ppm_all, data_all, expno_list
 
     @staticmethod
     def load_txt_spectrum(txt_data):
         if "ppm" not in txt_data.columns:
             raise ValueError("Column 'ppm' missing")
-        ppm = txt_data.ppm.values.tolist()
+        ppm = np.array(txt_data.ppm.values, dtype=float)
         data = np.array(txt_data.loc[:, txt_data.columns != 'ppm']).transpose()
         names = [int(i) for i in txt_data.columns[txt_data.columns != 'ppm'].tolist()]
 
-        ppm_all = np.array([ppm for l in range(data.shape[0])])
+        # chemical shift axis shared by all spectra
+        ppm_all = ppm[np.newaxis, :]
 
         return ppm_all, data, names
 
     @staticmethod
-    def load_2D_spectrum(data_path, dataset, expno, procno):
+    def load_2D_spectrum(data_path, dataset, expno, procno, lazy=False, cache=None):
         """Load 2D NMR spectra.
 
+        Args:
+            lazy (bool, optional): memory-map the processed data file, rows being read only when they are accessed
+                                   (see Bruker2DData). Data are fully loaded in memory if they cannot be memory-mapped. Defaults to False.
+            cache (DataCache, optional): cache of decoded datasets, not used if None. Data are saved in the cache only
+                                         once they have been fully loaded (i.e. not when they are memory-mapped). Defaults to None.
+
         Returns:
-            list: chemical shift
-            list: intensity
+            np.ndarray: chemical shift (axis shared by all spectra, with shape (1, n_points))
+            np.ndarray | Bruker2DData: intensity
+            list: names of spectra
         """
         # get complete data path
 
         full_path = Path(data_path, dataset, expno, 'pdata', procno)
 
+        # get dataset from cache (intensities are memory-mapped)
+        key = None
+        if cache is not None:
+            try:
+                key = cache.key([full_path], "pseudo2D")
+                cached = cache.get(key)
+            except OSError:
+                key, cached = None, None
+            if cached is not None:
+                return cached
+
+        # memory-map processed data
+        data = None
+        if lazy:
+            try:
+                dic, data = Bruker2DData.from_pdata(full_path)
+            except Exception as e:
+                logger.warning(f"Unable to memory-map processed data ('{e}'), data are fully loaded.")
+                data = None
+
         # read processed data
         try:
-            dic, data = ng.bruker.read_pdata(str(full_path), read_procs=True, read_acqus=False, scale_data=True, all_components=False)
-            # extract ppm and intensities
-            udic = ng.bruker.guess_udic(dic, data)
+            if data is None:
+                dic, data = ng.bruker.read_pdata(str(full_path), read_procs=True, read_acqus=False, scale_data=True, all_components=False)
+                data = np.array(data)
+            # extract ppm and intensities (only the shape of data is used)
+            udic = ng.bruker.guess_udic(dic, np.broadcast_to(0., data.shape))
             uc_F = ng.fileiobase.uc_from_udic(udic, 1)
             ppm = pd.Series(uc_F.ppm_scale())
             names = list(range(1, data.shape[0]+1))
         except Exception as e:
             raise ValueError("An unknown error has occurred when opening spectrum: '{}'. Please check your inputs.".format(e))
 
-        data = np.array(data)
-        ppm_all = np.array([ppm for l in range(data.shape[0])])
+        # chemical shift axis shared by all spectra
+        ppm_all = np.array(ppm)[np.newaxis, :]
+
+        if key is not None and isinstance(data, np.ndarray):
+            cache.put(key, ppm_all, data, names)
 
         return ppm_all, data, names
 
@@ -1,20 +1,101 @@
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from multiprocessing import Manager
+import queue
 import pandas as pd
 import nmrglue as ng
 import numpy as np
 import logging
 import string
 import pickle
+import json
+import os
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import multinmrfit.base.io as io
 import multinmrfit.base.spectrum as spectrum
-import copy
+import multinmrfit.base.global_fit as global_fit
+import multinmrfit.base.store as store
+from scipy.optimize import OptimizeResult
 
 
 # create logger
 logger = logging.getLogger(__name__)
 
+# maximal number of data points read at once when processing all rows of large datasets
+CHUNK_SIZE = 2**22
+
+# minimal number of spectra fitted by each worker process, fewer spectra are fitted in the main process (the overhead of starting
+# worker processes and transferring spectra would exceed the gain)
+MIN_SPECTRA_PER_WORKER = 4
+
+
+def _fit_chain(ref_spectrum, spectra, update_pars_from_previous=True, update_cnstr_wd=None, method="L-BFGS-B", progress=None, reseed_head=False):
+    """Fit sequentially a chain of spectra, each spectrum being fitted using the previous one as reference.
+    Defined at module level to be executed in worker processes.
+
+    Args:
+        ref_spectrum (Spectrum): spectrum used as reference for the first spectrum of the chain.
+        spectra (list): spectra to fit (with models already built).
+        update_pars_from_previous (bool, optional): use best fit of the previous spectrum as initial values. Defaults to True.
+        update_cnstr_wd (pd.DataFrame, optional): constraints windows used to update bounds, bounds are not updated if None. Defaults to None.
+        method (str, optional): optimization method. Defaults to "L-BFGS-B".
+        progress (queue.Queue, optional): queue where (rowno, ref, journal record) is put each time a spectrum has been fitted. Defaults to None.
+        reseed_head (bool, optional): keep the bounds of the reference spectrum for the first spectrum of the chain, i.e. bounds
+            are not updated from constraints windows (which assume that consecutive spectra are close). Defaults to False.
+
+    Returns:
+        list: fitted spectra
+    """
+
+    previous = ref_spectrum
+    for i, sp in enumerate(spectra):
+        cnstr_wd = None if (reseed_head and i == 0) else update_cnstr_wd
+        Process._seed_spectrum(sp, previous, update_pars_from_previous=update_pars_from_previous, update_cnstr_wd=cnstr_wd)
+        sp.fit(method=method)
+        if progress is not None:
+            progress.put((sp.rowno, previous.rowno, Process._journal_record(sp, previous.rowno)))
+        previous = sp
+
+    return spectra
+
+
+# spectra of reference of the chains and progress queue of a worker process, sent once to each worker (see _init_worker())
+_worker_references = {}
+_worker_progress = None
+
+
+def _init_worker(references, progress):
+    """Store the spectra of reference of all chains and the progress queue in a worker process, when the worker starts.
+
+    Args:
+        references (dict): spectra of reference, by (region, rowno).
+        progress (queue.Queue): queue where (rowno, ref, journal record) is put each time a spectrum has been fitted.
+    """
+
+    global _worker_references, _worker_progress
+    _worker_references = references
+    _worker_progress = progress
+
+
+def _fit_chain_in_worker(key, spectra, update_pars_from_previous=True, update_cnstr_wd=None, method="L-BFGS-B", reseed_head=False):
+    """Fit sequentially a chain of spectra in a worker process (see _fit_chain()), the spectrum of reference and the
+    progress queue being those sent to the worker when it started.
+
+    Args:
+        key (tuple): spectrum used as reference for the first spectrum of the chain, as (region, rowno).
+        spectra (list): spectra to fit (with models already built).
+        update_pars_from_previous (bool, optional): use best fit of the previous spectrum as initial values. Defaults to True.
+        update_cnstr_wd (pd.DataFrame, optional): constraints windows used to update bounds, bounds are not updated if None. Defaults to None.
+        method (str, optional): optimization method. Defaults to "L-BFGS-B".
+        reseed_head (bool, optional): keep the bounds of the reference spectrum for the first spectrum of the chain. Defaults to False.
+
+    Returns:
+        list: fitted spectra
+    """
+
+    return _fit_chain(_worker_references[key], spectra, update_pars_from_previous, update_cnstr_wd, method, _worker_progress, reseed_head)
+
 
 class Process(object):
     """This class is responsible for interacting with a set of spectra to process:
@@ -32,7 +113,9 @@ class Process(object):
         """Construct the Process object.
 
         Args:
-            dataset (dict): input data, a dict to load the data from Topspin files.
+            dataset (dict): input data, a dict to load the data from Topspin files. Processed data of pseudo 2D
+                            spectra are memory-mapped unless dataset['lazy'] is False, and decoded Topspin data are
+                            saved in the cache (see io.DataCache) unless dataset['cache'] is False.
             window (tuple, optional): lower and upper bounds of the window of interest (in ppm) or full spectrum if None. Defaults to None.
         """
 
@@ -56,17 +139,22 @@ class Process(object):
         # initialize attributes
         self.current_spectrum = None
         self.results = {}
+        self._index = None
         self.consolidated_results = None
+        self.journal_file = None
+        self._journal_restored = set()
         # self.use_ref_cnstr_wd = True
 
-        # load spectrum
+        # load spectrum (chemical shift axis is shared by all rows when possible)
+        cache = io.DataCache() if dataset.get("cache", True) else None
         if self.analysis_type == "pseudo2D":
-            self.ppm_full, self.data_full, self.names = self.io.load_2D_spectrum(self.data_path, self.dataset, self.expno, self.procno)
+            self.ppm_axes, self.data_full, self.names = self.io.load_2D_spectrum(self.data_path, self.dataset, self.expno, self.procno,
+                                                                                 lazy=dataset.get("lazy", True), cache=cache)
         elif self.analysis_type == "list of 1Ds":
             expno_list = self.build_list(self.expno)
-            self.ppm_full, self.data_full, self.names = self.io.load_1D_spectrum(self.data_path, self.dataset, self.procno, expno_list)
+            self.ppm_axes, self.data_full, self.names = self.io.load_1D_spectrum(self.data_path, self.dataset, self.procno, expno_list, cache=cache)
         elif self.analysis_type == "txt data":
-            self.ppm_full, self.data_full, self.names = self.io.load_txt_spectrum(self.txt_data)
+            self.ppm_axes, self.data_full, self.names = self.io.load_txt_spectrum(self.txt_data)
         else:
             raise ValueError(f"Analysis_type '{self.analysis_type}' not implemented yet.")
 
@@ -80,25 +168,93 @@ class Process(object):
         self.spectra_list = list(range(0, self.exp_dim[0]))
 
         # set default window (full spectrum)
-        window = (max(self.ppm_full[:, -1]), min(self.ppm_full[:, 0]))
+        window = (max(self.ppm_axes[:, -1]), min(self.ppm_axes[:, 0]))
 
         # create default spectrum
         self.set_current_spectrum(dataset.get("rowno", self.names[0]), window=window)
 
+    def __getstate__(self):
+        # consolidated results of each spectrum and spectra saved in the process folder are only kept in memory
+        state = self.__dict__.copy()
+        state.pop("_consolidated_blocks", None)
+        state.pop("_store_registry", None)
+        return state
+
+    def __setstate__(self, state):
+        # process files saved by previous versions contain the chemical shift axis of each row
+        if "ppm_full" in state:
+            state["ppm_axes"] = io.IoHandler.shared_ppm_axis(state.pop("ppm_full"))
+        self.__dict__.update(state)
+
+    @property
+    def ppm_full(self):
+        """Chemical shift axis of each row (read-only view of the shared axis if all rows share the same axis)."""
+        return np.broadcast_to(self.ppm_axes, (self.data_full.shape[0], self.ppm_axes.shape[1]))
+
+    @ppm_full.setter
+    def ppm_full(self, ppm_full):
+        self.ppm_axes = io.IoHandler.shared_ppm_axis(ppm_full)
+        self._monotonic_ppm = None
+
+    def get_row(self, rowno):
+        """Get chemical shift and intensity of a row (as views on the full dataset).
+
+        Args:
+            rowno (int): rowno of the spectrum.
+
+        Returns:
+            np.ndarray: chemical shift
+            np.ndarray: intensity
+        """
+
+        i = self.names.index(rowno)
+
+        return self.ppm_axes[0 if self.ppm_axes.shape[0] == 1 else i], self.data_full[i]
+
+    def _create_spectrum(self, rowno, window, from_ref=None):
+        """Create a spectrum from a row of the dataset. The window is extracted by binary search when the chemical
+        shift axis is monotonic (checked once), without copying the full row.
+
+        Args:
+            rowno (int): rowno of the spectrum.
+            window (tuple): lower and upper bounds of the window of interest (in ppm).
+            from_ref (int, optional): rowno of the spectrum used as reference. Defaults to None.
+
+        Returns:
+            Spectrum: spectrum
+        """
+
+        ppm, intensity = self.get_row(rowno)
+
+        if getattr(self, "_monotonic_ppm", None) is None:
+            self._monotonic_ppm = all(io.IoHandler.is_monotonic(axis) for axis in self.ppm_axes)
+
+        if self._monotonic_ppm:
+            return spectrum.Spectrum.from_arrays(ppm, intensity, window=window, from_ref=from_ref, rowno=rowno)
+
+        tmp_data = pd.DataFrame({"ppm": ppm, "intensity": intensity})
+        return spectrum.Spectrum(data=tmp_data, window=window, from_ref=from_ref, rowno=rowno)
+
     def clean_empty_rows(self):
         """ Removes rows filled with 0 
         """
-        clean_data = self.data_full[~np.all(self.data_full == 0, axis=1)]
-        clean_ppm_full = self.ppm_full[~np.all(self.data_full == 0, axis=1)]
-
-        self.data_full = clean_data
-        self.ppm_full = clean_ppm_full
+        # rows are checked by chunks, so large (memory-mapped) datasets are not fully loaded in memory
+        chunk_size = max(1, CHUNK_SIZE // self.data_full.shape[1])
+        mask = np.concatenate([np.any(self.data_full[i:i+chunk_size] != 0, axis=1) for i in range(0, self.data_full.shape[0], chunk_size)])
+
+        # data are only copied if some rows are removed
+        if not mask.all():
+            if isinstance(self.data_full, io.Bruker2DData):
+                self.data_full = self.data_full.select_rows(mask)
+            else:
+                self.data_full = self.data_full[mask]
+            if self.ppm_axes.shape[0] > 1:
+                self.ppm_axes = self.ppm_axes[mask]
 
         self.names = self.names[:self.data_full.shape[0]]
 
     def add_region(self):
-        self.results[self.current_spectrum.rowno] = self.results.get(self.current_spectrum.rowno, {})
-        self.results[self.current_spectrum.rowno][self.current_spectrum.region] = copy.deepcopy(self.current_spectrum)
+        self._set_result(self.current_spectrum.rowno, self.current_spectrum.region, self.current_spectrum.snapshot())
 
     def delete_region(self, rowno, region):
         if rowno is None:
@@ -108,6 +264,7 @@ class Process(object):
                     del self.results[s][region]
                     if not len(self.results[s]):
                         del self.results[s]
+                    self._update_index(s, region)
                 except:
                     pass
         else:
@@ -115,9 +272,79 @@ class Process(object):
                 del self.results[rowno][region]
                 if not len(self.results[rowno]):
                     del self.results[rowno]
+                self._update_index(rowno, region)
             except:
                 pass
 
+    def _set_result(self, rowno, region, sp):
+        """Save a spectrum in results, and update the index of results.
+
+        Args:
+            rowno (int): rowno of the spectrum.
+            region (str): region.
+            sp (Spectrum): spectrum.
+        """
+
+        self.results[rowno] = self.results.get(rowno, {})
+        self.results[rowno][region] = sp
+        self._update_index(rowno, region, tuple(sp.params["signal_id"]))
+
+    def _update_index(self, rowno, region, signal_ids=None):
+        """Update the index of results (signals of each spectrum & region), used by regions(), compounds() and spectra().
+
+        Args:
+            rowno (int): rowno of the spectrum.
+            region (str): region.
+            signal_ids (tuple, optional): signals of the spectrum, or None if the spectrum has been removed from results. Defaults to None.
+        """
+
+        index = self._get_index()
+        if signal_ids is None:
+            index.pop((rowno, region), None)
+        else:
+            index[(rowno, region)] = signal_ids
+
+        # lookups are cached until results are modified
+        self._lookups = {}
+
+    def _get_index(self) -> dict:
+        """Get the index of results, built from results if missing (e.g. for processes loaded from a file). Spectra of
+        processes loaded from a processing folder are indexed from their records, without being rebuilt.
+
+        Returns:
+            dict: signals of each spectrum, as {(rowno, region): (signal_id, ...)}
+        """
+
+        if getattr(self, "_index", None) is None:
+            self._index, self._lookups = {}, {}
+            for rowno, regions in self.results.items():
+                for region in regions.keys():
+                    record = regions.record(region) if isinstance(regions, store.LazyRegions) else None
+                    if record is None:
+                        signal_ids = regions[region].params["signal_id"]
+                    else:
+                        signal_ids = [] if record["params"] is None else record["params"]["signal_id"]
+                    self._index[(rowno, region)] = tuple(signal_ids)
+
+        return self._index
+
+    def _lookup(self, key, func) -> list:
+        """Get the result of a lookup on the index of results, cached until results are modified.
+
+        Args:
+            key (tuple): lookup key.
+            func (callable): function which calculates the lookup from the index.
+
+        Returns:
+            list: result of the lookup
+        """
+
+        index = self._get_index()
+        if key not in self._lookups:
+            self._lookups[key] = sorted(set(func(index)))
+
+        return list(self._lookups[key])
+
     def update_pp_threshold(self, pp_threshold):
         """Update peak picking threshold, and detect peaks.
 
@@ -134,6 +361,89 @@ class Process(object):
         # detect peaks
         self.current_spectrum.edited_peak_table = self.current_spectrum.peak_picking(pp_threshold)
 
+    def peak_picking(self, window, rownos=None, threshold=None, noise_factor=5.0) -> pd.DataFrame:
+        """Peak picking of a window on several rows of the dataset, without building spectra. Rows are processed by
+        chunks (so large memory-mapped datasets are not fully loaded in memory), and peaks are detected on all rows of
+        a chunk at once as the local maxima above threshold (as with the 'downward' algorithm of Spectrum.peak_picking()).
+
+        Args:
+            window (tuple): lower and upper bounds of the window of interest (in ppm).
+            rownos (list, optional): rownos of the spectra, all spectra if None. Defaults to None.
+            threshold (float | list, optional): threshold value, shared by all rows (float) or for each row (list). If None,
+                                                the threshold of each row is estimated from its noise. Defaults to None.
+            noise_factor (float, optional): threshold estimated from noise, as median intensity + noise_factor x standard
+                                            deviation of noise (estimated from differences between consecutive points). Defaults to 5.0.
+
+        Returns:
+            pd.DataFrame: peak table, with columns 'rowno', 'ppm' and 'intensity' (one line per peak, sorted by rowno and ppm)
+        """
+
+        logger.debug("peak picking on several rows")
+
+        rownos = list(self.names) if rownos is None else list(rownos)
+        index = {name: i for i, name in enumerate(self.names)}
+        missing = [rowno for rowno in rownos if rowno not in index]
+        if len(missing):
+            raise ValueError(f"Spectra {missing} not found.")
+        rows = np.array([index[rowno] for rowno in rownos], dtype=int)
+
+        if threshold is not None:
+            threshold = np.broadcast_to(np.asarray(threshold, dtype=float), (len(rows),))
+
+        if getattr(self, "_monotonic_ppm", None) is None:
+            self._monotonic_ppm = all(io.IoHandler.is_monotonic(axis) for axis in self.ppm_axes)
+
+        peaks = []
+
+        # rows with the same chemical shift axis are processed by chunks, other rows one by one
+        if self.ppm_axes.shape[0] == 1 and self._monotonic_ppm:
+            window_slice = io.IoHandler.window_slice(self.ppm_axes[0], window)
+            ppm = np.asarray(self.ppm_axes[0][window_slice], dtype=float)
+            chunk_size = max(1, CHUNK_SIZE // max(1, len(ppm)))
+            chunks = [(np.arange(i, min(i + chunk_size, len(rows))), window_slice) for i in range(0, len(rows), chunk_size)]
+        else:
+            chunks = []
+            for i, row in enumerate(rows):
+                axis = self.ppm_axes[0 if self.ppm_axes.shape[0] == 1 else row]
+                if self._monotonic_ppm:
+                    chunks.append((np.array([i]), io.IoHandler.window_slice(axis, window)))
+                else:
+                    chunks.append((np.array([i]), np.nonzero((axis >= min(window)) & (axis <= max(window)))[0]))
+
+        for idx, columns in chunks:
+            if self.ppm_axes.shape[0] > 1 or not self._monotonic_ppm:
+                ppm = np.asarray(self.ppm_axes[0 if self.ppm_axes.shape[0] == 1 else rows[idx[0]]][columns], dtype=float)
+            if not len(ppm):
+                continue
+
+            # contiguous rows are read as a slice
+            row_key = slice(rows[idx[0]], rows[idx[-1]] + 1) if np.all(np.diff(rows[idx]) == 1) else rows[idx]
+            intensity = np.asarray(self.data_full[row_key, columns], dtype=float)
+
+            # threshold of each row
+            if threshold is None:
+                noise = np.median(np.abs(np.diff(intensity, axis=1)), axis=1) / (0.6745 * np.sqrt(2)) if len(ppm) > 1 else np.zeros(len(idx))
+                row_threshold = np.median(intensity, axis=1) + noise_factor * noise
+            else:
+                row_threshold = threshold[idx]
+
+            # local maxima above threshold
+            padded = np.pad(intensity, ((0, 0), (1, 1)), constant_values=-np.inf)
+            is_peak = (intensity > padded[:, :-2]) & (intensity >= padded[:, 2:]) & (intensity >= row_threshold[:, None])
+            i, j = np.nonzero(is_peak)
+            peaks.append(pd.DataFrame({"rowno": np.asarray(rownos)[idx[i]],
+                                       "ppm": ppm[j],
+                                       "intensity": intensity[i, j]}))
+
+        if not len(peaks):
+            return pd.DataFrame(columns=["rowno", "ppm", "intensity"])
+
+        peak_table = pd.concat(peaks, ignore_index=True)
+        peak_table.sort_values(by=["rowno", "ppm"], inplace=True, kind="stable")
+        peak_table.reset_index(inplace=True, drop=True)
+
+        return peak_table
+
     def set_current_spectrum(self, rowno, window):
         """Set reference spectrum.
 
@@ -146,18 +456,15 @@ class Process(object):
 
         if self.results.get(rowno, {}).get(region, None) is None:
 
-            # extract reference spectrum
-            tmp_data = pd.concat([pd.Series(self.ppm_full[self.names.index(rowno), :]), pd.Series(self.data_full[self.names.index(rowno), :])], axis=1)
-            tmp_data.columns = ["ppm", "intensity"]
-            # create spectrum
-            self.current_spectrum = spectrum.Spectrum(data=tmp_data, window=window, rowno=rowno)
+            # create reference spectrum
+            self.current_spectrum = self._create_spectrum(rowno, window)
 
             # update pp threshold
-            self.update_pp_threshold(max(self.current_spectrum.intensity)/5)
+            self.update_pp_threshold(float(np.max(self.current_spectrum.intensity))/5)
 
         else:
 
-            self.current_spectrum = copy.deepcopy(self.results[rowno][region])
+            self.current_spectrum = self.results[rowno][region].snapshot()
 
     def model_cluster_assignment(self):
         """Estimate the number of peaks per model
@@ -248,6 +555,21 @@ class Process(object):
             spectrum (optional, int): rowno of the spectrum to update, reference spectrum if None. Default to None.
         """
 
+        # update parameters
+        if spectrum is None:
+            self._set_spectrum_params(self.current_spectrum, params)
+        else:
+            self._set_spectrum_params(self.results[spectrum][region], params)
+
+    @staticmethod
+    def _set_spectrum_params(sp, params):
+        """Update parameters of a spectrum.
+
+        Args:
+            sp (Spectrum): spectrum to update.
+            params (pd.DataFrame): values of new parameters, with same format as Spectrum.params.
+        """
+
         # build dictionary from dataframe to update parameters
         pars = {}
         offset = None
@@ -263,12 +585,8 @@ class Process(object):
                     pars[signal_id]["par"][par][k] = params[k][s]
 
         # update parameters
-        if spectrum is None:
-            self.current_spectrum.update_params(pars)
-            self.current_spectrum.update_offset(offset)
-        else:
-            self.results[spectrum][region].update_params(pars)
-            self.results[spectrum][region].update_offset(offset)
+        sp.update_params(pars)
+        sp.update_offset(offset)
 
     @staticmethod
     def build_list(user_input):
@@ -305,74 +623,49 @@ class Process(object):
         experiment_list = self.build_list(user_input)
 
         experiment_list = [i for i in experiment_list if i in self.names]
-        exclude = [ref] if reprocess else [k for k in self.results.keys() if region in list(self.results[k].keys())] + [ref]
+        exclude = [ref] if reprocess else self.spectra(region) + [ref]
         experiment_list = [i for i in experiment_list if i not in exclude]
 
         return experiment_list
 
     def regions(self, rowno=None):
+        """Get regions of all spectra, or of a given spectrum.
 
-        # get regions
-        if rowno is None:
-            regions = []
-            for _, r in self.results.items():
-                regions += list(r.keys())
-        else:
-            regions = list(self.results.get(rowno, {}).keys())
-
-        # remove duplicates
-        regions = list(set(regions))
+        Args:
+            rowno (int, optional): rowno of the spectrum, all spectra if None. Defaults to None.
 
-        # sort
-        if regions is not None:
-            regions.sort()
+        Returns:
+            list: sorted regions
+        """
 
-        return regions
+        return self._lookup(("regions", rowno), lambda index: [r for (n, r) in index if rowno is None or n == rowno])
 
     def compounds(self, rowno=None, region=None):
+        """Get signals of all spectra (or of a given spectrum) and regions (or of a given region).
 
-        # get regions
-        compounds = []
-        if rowno is None:
-            for r in self.results.values():
-                if region is None:
-                    for s in r.values():
-                        compounds += s.params.signal_id.values.tolist()
-                else:
-                    if region in r.keys():
-                        compounds += r[region].params.signal_id.values.tolist()
-        else:
-            if region is None:
-                for s in self.results[rowno].values():
-                    compounds += s.params.signal_id.values.tolist()
-            else:
-                compounds = self.results[rowno][region].params.signal_id.values.tolist()
-
-        # remove 'full spectrum'
-        compounds = [i for i in compounds if i != "full_spectrum"]
-
-        # remove duplicates
-        compounds = list(set(compounds))
+        Args:
+            rowno (int, optional): rowno of the spectrum, all spectra if None. Defaults to None.
+            region (str, optional): region, all regions if None. Defaults to None.
 
-        # sort
-        if compounds is not None:
-            compounds.sort()
+        Returns:
+            list: sorted signals (except 'full_spectrum')
+        """
 
-        return compounds
+        return self._lookup(("compounds", rowno, region),
+                            lambda index: [i for (n, r), signal_ids in index.items() if (rowno is None or n == rowno) and (region is None or r == region)
+                                           for i in signal_ids if i != "full_spectrum"])
 
     def spectra(self, region=None):
+        """Get spectra with results (for all regions, or for a given region).
 
-        # get spectra
-        if region is None:
-            spectra = list(self.results.keys())
-        else:
-            spectra = [k for k in self.results.keys() if region in self.results[k].keys()]
+        Args:
+            region (str, optional): region, all regions if None. Defaults to None.
 
-        # sort
-        if spectra is not None:
-            spectra.sort()
+        Returns:
+            list: sorted rownos
+        """
 
-        return spectra
+        return self._lookup(("spectra", region), lambda index: [n for (n, r) in index if region is None or r == region])
 
     @staticmethod
     def update_cnstr_wd(params, cnstr_wd):
@@ -407,7 +700,7 @@ class Process(object):
         # if some initial parameters are outside the bounds, adjust bounds
         # identify params with negative initial values
         mask_neg = (params['ini'] < 0)
-        mask_pos = [not i for i in mask_neg]
+        mask_pos = ~mask_neg
         # set lower bounds
         mask = (params['ini'] < params['lb'])
         params.loc[(mask & mask_neg), "lb"] = params.loc[(mask & mask_neg), "ini"]*10
@@ -419,18 +712,21 @@ class Process(object):
 
         return params
 
-    def fit_from_ref(self, rowno, region, ref, update_pars_from_previous=True, update_cnstr_wd=None, method="L-BFGS-B"):
-        """Fit a spectrum using another spectrum as reference.
+    def _create_spectrum_from_ref(self, rowno, region, ref):
+        """Create a spectrum, with the same window and model as a spectrum of reference.
 
         Args:
-            rowno (int): rowno of the spectrum to fit.
+            rowno (int): rowno of the spectrum to create.
+            region (str): region.
             ref (int): rowno of the spectrum used as reference.
+
+        Returns:
+            Spectrum: spectrum
         """
 
         # create spectrum
-        tmp_data = pd.concat([pd.Series(self.ppm_full[self.names.index(rowno), :]), pd.Series(self.data_full[self.names.index(rowno), :])], axis=1)
-        tmp_data.columns = ["ppm", "intensity"]
-        sp = spectrum.Spectrum(data=tmp_data, window=self.results[ref][region].window, from_ref=ref, rowno=rowno)
+        sp = self._create_spectrum(rowno, self.results[ref][region].window, from_ref=ref)
+        sp.region = region
 
         # build model
         offset = {} if self.results[ref][region].offset else None
@@ -438,13 +734,21 @@ class Process(object):
                        available_models=self.models,
                        offset=offset)
 
-        # save spectrum
-        self.results[rowno] = self.results.get(rowno, {})
-        self.results[rowno][region] = sp
+        return sp
+
+    @staticmethod
+    def _seed_spectrum(sp, ref_spectrum, update_pars_from_previous=True, update_cnstr_wd=None):
+        """Set parameters of a spectrum from a spectrum of reference.
+
+        Args:
+            sp (Spectrum): spectrum to update.
+            ref_spectrum (Spectrum): spectrum used as reference.
+            update_pars_from_previous (bool, optional): use best fit of the reference spectrum as initial values. Defaults to True.
+            update_cnstr_wd (pd.DataFrame, optional): constraints windows used to update bounds, bounds are not updated if None. Defaults to None.
+        """
 
         # get params from previous spectrum
-        prev_params = self.results[ref][region].params.copy(deep=True)
-        #print(f"Previous params:\n{prev_params}")
+        prev_params = ref_spectrum.params.copy(deep=True)
 
         # update initial values
         if update_pars_from_previous:
@@ -452,24 +756,526 @@ class Process(object):
 
         # update bounds
         if update_cnstr_wd is not None:
-            prev_params = self.update_cnstr_wd(prev_params, update_cnstr_wd)
+            prev_params = Process.update_cnstr_wd(prev_params, update_cnstr_wd)
 
-        #print(f"Updated params:\n{prev_params}")
+        # update params in spectrum
+        Process._set_spectrum_params(sp, prev_params)
+
+    def fit_from_ref(self, rowno, region, ref, update_pars_from_previous=True, update_cnstr_wd=None, method="L-BFGS-B"):
+        """Fit a spectrum using another spectrum as reference.
+
+        Args:
+            rowno (int): rowno of the spectrum to fit.
+            ref (int): rowno of the spectrum used as reference.
+        """
+
+        # create spectrum
+        sp = self._create_spectrum_from_ref(rowno, region, ref)
+
+        # save spectrum
+        self._set_result(rowno, region, sp)
 
         # update params in spectrum
-        self.update_params(prev_params, spectrum=rowno, region=region)
+        self._seed_spectrum(sp, self.results[ref][region], update_pars_from_previous=update_pars_from_previous, update_cnstr_wd=update_cnstr_wd)
 
         # fit
-        self.results[rowno][region].fit(method=method)
+        sp.fit(method=method)
+        self._write_journal([self._journal_record(sp, ref)])
+
+    def _fit_chains(self, chains, update_pars_from_previous=True, update_cnstr_wd=None, method="L-BFGS-B", workers=None, callback=None, reseeded=()):
+        """Fit independent chains of spectra in parallel. Each chain is fitted sequentially, the first spectrum
+        using the spectrum of reference of the chain and the following ones using the previous spectrum.
 
-    def save_process_to_file(self):
+        Args:
+            chains (list): chains to fit, as tuples (region, ref, list of rownos).
+            update_pars_from_previous (bool, optional): use best fit of the previous spectrum as initial values. Defaults to True.
+            update_cnstr_wd (pd.DataFrame | dict, optional): constraints windows used to update bounds (or dict with constraints windows of each
+                region), bounds are not updated if None. Defaults to None.
+            method (str, optional): optimization method. Defaults to "L-BFGS-B".
+            workers (int, optional): maximal number of worker processes (at least MIN_SPECTRA_PER_WORKER spectra are fitted by each worker),
+                number of processors of the machine if None. Defaults to None.
+            callback (function, optional): function called with arguments (rowno, ref) each time a spectrum has been fitted. Defaults to None.
+            reseeded (list, optional): spectra heading a chain which keep the bounds of the reference spectrum, as tuples (region, rowno). Defaults to ().
+        """
+
+        # create spectra in the main process, they are fitted in worker processes
+        jobs = [(region, ref, [self._create_spectrum_from_ref(rowno, region, ref) for rowno in rownos]) for region, ref, rownos in chains]
+
+        def cnstr_wd(region):
+            return update_cnstr_wd.get(region, None) if isinstance(update_cnstr_wd, dict) else update_cnstr_wd
+
+        # use only as many worker processes as there is enough work for
+        workers = os.cpu_count() if workers is None else workers
+        workers = min(workers, len(jobs), sum(len(spectra) for _, _, spectra in jobs) // MIN_SPECTRA_PER_WORKER)
+
+        # fitted spectra are saved as soon as they are available in the serial path, and in the order of chains when worker processes are used
+        if workers <= 1:
+            for region, ref, spectra in jobs:
+                previous = self.results[ref][region]
+                for sp in spectra:
+                    _fit_chain(previous, [sp], update_pars_from_previous, cnstr_wd(region), method, reseed_head=(region, sp.rowno) in reseeded)
+                    self._set_result(sp.rowno, region, sp)
+                    self._write_journal([self._journal_record(sp, previous.rowno)])
+                    if callback is not None:
+                        callback(sp.rowno, previous.rowno)
+                    previous = sp
+        else:
+            # spectra of reference (and the progress queue) are sent once to each worker process, not with each chain
+            references = {(region, ref): self.results[ref][region] for region, ref, _ in jobs}
+            fitted = {}
+
+            with Manager() as manager:
+
+                # progress of all workers is merged in a single queue
+                progress = manager.Queue()
+                executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(references, progress))
+
+                def notify():
+                    while True:
+                        try:
+                            rowno, ref, record = progress.get_nowait()
+                        except queue.Empty:
+                            return
+                        self._write_journal([record])
+                        if callback is not None:
+                            callback(rowno, ref)
+
+                try:
+                    futures = {executor.submit(_fit_chain_in_worker, (region, ref), spectra, update_pars_from_previous, cnstr_wd(region), method,
+                                               (region, spectra[0].rowno) in reseeded): i
+                               for i, (region, ref, spectra) in enumerate(jobs)}
+                    pending = set(futures)
+                    while pending:
+                        done, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                        notify()
+                        for future in done:
+                            fitted[futures[future]] = future.result()
+                    notify()
+                except BaseException:
+                    # do not wait for the chains being fitted (e.g. when the fit is stopped by the user)
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    raise
+                else:
+                    executor.shutdown()
+                finally:
+                    # save fitted spectra in the order of chains (including chains fitted before an interruption)
+                    for i in sorted(fitted):
+                        for sp in fitted[i]:
+                            self._set_result(sp.rowno, jobs[i][0], sp)
+
+    def fit_from_ref_parallel(self, rownos, region, ref, update_pars_from_previous=True, update_cnstr_wd=None, method="L-BFGS-B", workers=None, callback=None):
+        """Fit several spectra independently using the same spectrum as reference, in parallel.
+
+        Args:
+            rownos (list): rownos of the spectra to fit.
+            region (str): region.
+            ref (int): rowno of the spectrum used as reference for all spectra.
+            update_pars_from_previous (bool, optional): use best fit of the reference spectrum as initial values. Defaults to True.
+            update_cnstr_wd (pd.DataFrame, optional): constraints windows used to update bounds, bounds are not updated if None. Defaults to None.
+            method (str, optional): optimization method. Defaults to "L-BFGS-B".
+            workers (int, optional): number of worker processes, number of processors of the machine if None. Defaults to None.
+            callback (function, optional): function called with arguments (rowno, ref) each time a spectrum has been fitted. Defaults to None.
+        """
+
+        self.fit_regions([(rowno, region) for rowno in rownos], ref,
+                         update_pars_from_previous=update_pars_from_previous,
+                         update_cnstr_wd=update_cnstr_wd,
+                         method=method,
+                         workers=workers,
+                         callback=callback,
+                         chained=False)
+
+    def fit_series_from_ref(self, rownos, region, ref, update_pars_from_previous=True, update_cnstr_wd=None, method="L-BFGS-B", workers=None, callback=None,
+                            segments=1):
+        """Fit a series of spectra starting from a spectrum of reference, each spectrum being fitted using the previous
+        one as reference. Spectra above and below the reference are fitted as two independent chains, in parallel.
+
+        Long series can be split into several segments fitted in parallel. The first spectrum of each additional segment
+        is fitted directly from the spectrum of reference (keeping its bounds), and is then used as reference for the
+        following spectra of the segment. Parameters jumps at segments boundaries are returned to check the continuity
+        of the fitted parameters.
+
+        Args:
+            rownos (list): rownos of the spectra to fit.
+            region (str): region.
+            ref (int): rowno of the spectrum used as reference.
+            update_pars_from_previous (bool, optional): use best fit of the previous spectrum as initial values. Defaults to True.
+            update_cnstr_wd (pd.DataFrame, optional): constraints windows used to update bounds, bounds are not updated if None. Defaults to None.
+            method (str, optional): optimization method. Defaults to "L-BFGS-B".
+            workers (int, optional): number of worker processes, number of processors of the machine if None. Defaults to None.
+            callback (function, optional): function called with arguments (rowno, ref) each time a spectrum has been fitted. Defaults to None.
+            segments (int, optional): number of segments the series is split into. Defaults to 1.
+
+        Returns:
+            pd.DataFrame: parameters jumps at segments boundaries (empty if the series is not segmented)
+        """
+
+        jumps = self.fit_regions([(rowno, region) for rowno in rownos], ref,
+                                 update_pars_from_previous=update_pars_from_previous,
+                                 update_cnstr_wd=update_cnstr_wd,
+                                 method=method,
+                                 workers=workers,
+                                 callback=callback,
+                                 segments=segments)
+
+        return jumps.drop(columns="region")
+
+    def fit_regions(self, jobs, ref, update_pars_from_previous=True, update_cnstr_wd=None, method="L-BFGS-B", workers=None, callback=None,
+                    segments=1, chained=True, resume=False):
+        """Fit several regions of several spectra in parallel. Spectra of each region are fitted as in fit_series_from_ref
+        (or independently from the spectrum of reference if chained is False), and all chains of all regions are fitted
+        in parallel.
+
+        Args:
+            jobs (list): spectra to fit, as tuples (rowno, region).
+            ref (int | dict): rowno of the spectrum used as reference (or dict with rowno of the spectrum of reference of each region).
+            update_pars_from_previous (bool, optional): use best fit of the previous spectrum as initial values. Defaults to True.
+            update_cnstr_wd (pd.DataFrame | dict, optional): constraints windows used to update bounds (or dict with constraints windows of each
+                region), bounds are not updated if None. Defaults to None.
+            method (str, optional): optimization method. Defaults to "L-BFGS-B".
+            workers (int, optional): number of worker processes, number of processors of the machine if None. Defaults to None.
+            callback (function, optional): function called with arguments (rowno, ref) each time a spectrum has been fitted. Defaults to None.
+            segments (int, optional): number of segments the series of each region is split into. Defaults to 1.
+            chained (bool, optional): fit each spectrum using the previous one as reference if True, or using the spectrum of reference
+                if False. Defaults to True.
+            resume (bool, optional): resume an interrupted batch: spectra restored by load_journal() are skipped, and chains restart
+                from the last restored spectrum. Defaults to False.
+
+        Returns:
+            pd.DataFrame: parameters jumps at segments boundaries of each region (empty if series are not segmented)
+        """
+
+        # skip spectra restored from the journal
+        fitted = []
+        if resume:
+            restored = getattr(self, "_journal_restored", set())
+            fitted = [job for job in jobs if job in restored]
+            jobs = [job for job in jobs if job not in restored]
+
+        # gather spectra of each region, in the order of jobs
+        regions = {}
+        for rowno, region in jobs:
+            regions[region] = regions.get(region, []) + [rowno]
+
+        chains, series, heads = [], {}, []
+        for region, rownos in regions.items():
+            region_ref = ref[region] if isinstance(ref, dict) else ref
+            if chained:
+                region_chains, series[region], region_heads = self._series_chains(rownos, region_ref, segments)
+            else:
+                region_chains, series[region], region_heads = [[rowno] for rowno in rownos if rowno != region_ref], [], []
+            for chain in region_chains:
+                # restart from the last spectrum fitted before the interruption
+                chain_ref = region_ref
+                previous = [rowno for rowno, r in fitted if r == region and min(region_ref, chain[0]) < rowno < max(region_ref, chain[0])]
+                if chained and chain[0] not in region_heads and len(previous):
+                    chain_ref = min(previous, key=lambda rowno: abs(rowno - chain[0]))
+                chains.append((region, chain_ref, chain))
+            heads += [(region, rowno) for rowno in region_heads]
+
+        self._fit_chains(chains,
+                         update_pars_from_previous=update_pars_from_previous,
+                         update_cnstr_wd=update_cnstr_wd,
+                         method=method,
+                         workers=workers,
+                         callback=callback,
+                         reseeded=heads)
+
+        # check continuity at segments boundaries
+        jumps = []
+        for region in regions:
+            region_jumps = self._segments_jumps(region, series[region], [rowno for reg, rowno in heads if reg == region])
+            region_jumps.insert(0, "region", region)
+            jumps.append(region_jumps)
+
+        if not len(jumps):
+            return pd.DataFrame(columns=["region", "rowno_before", "rowno_after", "signal_id", "par", "opt_before", "opt_after", "delta", "median_delta"])
+
+        return pd.concat(jumps, ignore_index=True)
+
+    def fit_global(self, rownos, region, ref, shared=None, update_pars_from_previous=True, update_cnstr_wd=None, resume=False):
+        """Fit jointly a region of several spectra, some parameters being shared by all spectra (e.g. coupling constants
+        or linewidths) and the others being estimated for each spectrum. Parameters of all spectra are initialized from the
+        spectrum of reference.
+
+        Args:
+            rownos (list): rownos of the spectra to fit.
+            region (str): region.
+            ref (int): rowno of the spectrum used as reference.
+            shared (list, optional): shared parameters, as parameters names (e.g. 'J', shared for all signals) or
+                                     tuples (signal_id, par). Defaults to None.
+            update_pars_from_previous (bool, optional): use best fit of the spectrum of reference as initial values. Defaults to True.
+            update_cnstr_wd (pd.DataFrame, optional): constraints windows used to update bounds, bounds are not updated if None. Defaults to None.
+            resume (bool, optional): resume an interrupted batch: spectra restored by load_journal() are skipped. Defaults to False.
+
+        Returns:
+            scipy.optimize.OptimizeResult: optimization results of the global fit (None if there is no spectrum to fit)
+        """
+
+        # skip spectra restored from the journal
+        if resume:
+            restored = getattr(self, "_journal_restored", set())
+            rownos = [rowno for rowno in rownos if (rowno, region) not in restored]
+
+        if not len(rownos):
+            logger.info(f"no spectrum to fit in region {region}, global fit skipped.")
+            return None
+
+        # create spectra
+        spectra = []
+        for rowno in rownos:
+            sp = self._create_spectrum_from_ref(rowno, region, ref)
+            self._seed_spectrum(sp, self.results[ref][region], update_pars_from_previous=update_pars_from_previous, update_cnstr_wd=update_cnstr_wd)
+            spectra.append(sp)
+
+        # fit
+        res = global_fit.GlobalFit(spectra, shared=shared).fit()
+        self._write_journal([self._journal_record(sp, ref) for sp in spectra])
+
+        # save spectra
+        for sp in spectra:
+            self._set_result(sp.rowno, region, sp)
+
+        return res
+
+    @staticmethod
+    def _series_chains(rownos, ref, segments=1):
+        """Split a series of spectra into chains fitted sequentially, starting from a spectrum of reference.
+
+        Args:
+            rownos (list): rownos of the spectra to fit.
+            ref (int): rowno of the spectrum used as reference.
+            segments (int, optional): number of segments the series is split into. Defaults to 1.
+
+        Returns:
+            tuple: chains (lists of rownos, in fitting order), series of spectra above and below the reference,
+                   and rownos of spectra heading additional segments
+        """
+
+        if segments < 1:
+            raise ValueError(f"Number of segments must be higher than 0 (current value: {segments}).")
+
+        upper = sorted([i for i in rownos if i > ref])
+        lower = sorted([i for i in rownos if i < ref], reverse=True)
+
+        # split segments between both sides of the reference in proportion to their number of spectra
+        # (each non-empty side has at least one segment)
+        if len(upper) and len(lower):
+            n_upper = min(max(1, round(segments * len(upper) / (len(upper) + len(lower)))), max(1, segments - 1))
+            n_lower = max(1, segments - n_upper)
+        else:
+            n_upper, n_lower = segments, segments
+
+        # split each side into segments of (almost) the same size
+        chains, heads = [], []
+        for series, n in [(upper, min(n_upper, len(upper))), (lower, min(n_lower, len(lower)))]:
+            limits = [i * len(series) // n for i in range(n + 1)] if n else []
+            series_chains = [series[start:end] for start, end in zip(limits[:-1], limits[1:])]
+            chains += series_chains
+            heads += [chain[0] for chain in series_chains[1:]]
+
+        return chains, [upper, lower], heads
+
+    def _segments_jumps(self, region, chains, heads):
+        """Calculate parameters jumps at segments boundaries.
+
+        Args:
+            region (str): region.
+            chains (list): lists of rownos, in fitting order.
+            heads (list): rownos of spectra heading a segment.
+
+        Returns:
+            pd.DataFrame: parameters values at both sides of each boundary, their difference ('delta') and
+                          the median absolute difference between consecutive spectra within segments ('median_delta')
+        """
+
+        columns = ["rowno_before", "rowno_after", "signal_id", "par", "opt_before", "opt_after", "delta", "median_delta"]
+        jumps = []
+
+        for chain in chains:
+
+            if not any(b in heads for b in chain[1:]):
+                continue
+
+            # optimal values of parameters
+            opt = {r: self.results[r][region].params.set_index(["signal_id", "par"])["opt"] for r in chain}
+
+            # typical variation of parameters between consecutive spectra of the same segment
+            steps = [(opt[b] - opt[a]).abs() for a, b in zip(chain[:-1], chain[1:]) if b not in heads]
+            median_delta = pd.concat(steps, axis=1).median(axis=1) if len(steps) else np.nan
+
+            for a, b in zip(chain[:-1], chain[1:]):
+                if b in heads:
+                    jump = pd.DataFrame({"opt_before": opt[a], "opt_after": opt[b], "delta": opt[b] - opt[a], "median_delta": median_delta})
+                    jump.insert(0, "rowno_after", b)
+                    jump.insert(0, "rowno_before", a)
+                    jumps.append(jump.reset_index())
+
+        if not len(jumps):
+            return pd.DataFrame(columns=columns)
+
+        jumps = pd.concat(jumps, ignore_index=True)[columns]
+
+        return jumps
+
+    def open_journal(self, journal_file=None, resume=False):
+        """Start the checkpoint journal, where each fitted spectrum (parameters and fit statistics) is appended as
+        soon as it has been fitted.
+
+        Args:
+            journal_file (str, optional): path to the journal, '<filename>_journal.jsonl' in the output folder if None. Defaults to None.
+            resume (bool, optional): keep the records of the previous run (to restore them with load_journal()), otherwise
+                the journal is truncated so that spectra fitted during a previous run cannot be restored. Defaults to False.
+
+        Returns:
+            Path: path to the journal
+        """
+
+        if journal_file is None:
+            journal_file = Path(self.output_res_path, self.output_res_folder, self.filename + "_journal.jsonl")
+        self.journal_file = Path(journal_file)
+        self.journal_file.parent.mkdir(parents=True, exist_ok=True)
+        if not resume:
+            open(self.journal_file, "w").close()
+            self._journal_restored = set()
+
+        return self.journal_file
+
+    def close_journal(self):
+        """Stop the checkpoint journal."""
+
+        self.journal_file = None
+
+    @staticmethod
+    def _journal_record(sp, ref):
+        """Build the journal record of a fitted spectrum.
+
+        Args:
+            sp (Spectrum): fitted spectrum.
+            ref (int): rowno of the spectrum used as reference.
+
+        Returns:
+            dict: journal record
+        """
+
+        return {"rowno": sp.rowno,
+                "region": sp.region,
+                "ref": ref,
+                "window": sp.window,
+                "signals": sp.signals,
+                "offset": bool(sp.offset),
+                "params": sp.params.to_dict(orient="list"),
+                "fit_results": store.fit_statistics(sp.fit_results)}
+
+    def _write_journal(self, records):
+        """Append records to the checkpoint journal (if started).
+
+        Args:
+            records (list): journal records.
+        """
+
+        journal_file = getattr(self, "journal_file", None)
+        if journal_file is None:
+            return
+
+        with open(journal_file, "a") as f:
+            f.write("".join(json.dumps(record, default=store.to_json) + "\n" for record in records))
+
+    def load_journal(self, journal_file=None):
+        """Restore fitted spectra from a checkpoint journal (the last record of each spectrum is used).
+
+        Args:
+            journal_file (str, optional): path to the journal, '<filename>_journal.jsonl' in the output folder if None. Defaults to None.
+
+        Returns:
+            list: restored spectra, as tuples (rowno, region)
+        """
+
+        if journal_file is None:
+            journal_file = Path(self.output_res_path, self.output_res_folder, self.filename + "_journal.jsonl")
+
+        # read journal
+        records = {}
+        with open(journal_file, "r") as f:
+            for i, line in enumerate(f):
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"line {i+1} of journal '{journal_file}' is incomplete, it has been skipped.")
+                    continue
+                if record["rowno"] in self.names:
+                    records[(record["rowno"], record["region"])] = record
+
+        # restore spectra
+        for (rowno, region), record in records.items():
+            self._set_result(rowno, region, self._restore_spectrum(record))
+        self._journal_restored = getattr(self, "_journal_restored", set()) | set(records.keys())
+
+        return list(records.keys())
+
+    def _restore_spectrum(self, record):
+        """Rebuild a spectrum from its record (see _journal_record() and store.ProcessStore).
+
+        Args:
+            record (dict): record of the spectrum.
+
+        Returns:
+            Spectrum: spectrum
+        """
+
+        rowno = record["rowno"]
+        sp = self._create_spectrum(rowno, tuple(record["window"]), from_ref=record["ref"])
+        sp.region = record["region"]
+        sp.peakpicking_threshold = record.get("peakpicking_threshold", None)
+        sp.user_models = record.get("user_models", None)
+        for k in ["edited_peak_table", "_edited_peak_table"]:
+            if record.get(k, None) is not None:
+                setattr(sp, k, pd.DataFrame(record[k]["data"], columns=record[k]["columns"]))
+
+        # model & parameters
+        if record["signals"]:
+            # parameters are set all at once from the record
+            sp.build_model(signals={id: {"model": signal["model"]} for id, signal in record["signals"].items()},
+                           available_models=self.models,
+                           offset={} if record["offset"] else None)
+            sp.signals = record["signals"]
+            params = pd.DataFrame(record["params"])
+            sp._restore_params(params)
+            if record.get("cnstr_wd", None) is not None:
+                cnstr_wd = pd.DataFrame(record["cnstr_wd"])
+                if list(cnstr_wd["signal_id"]) == list(sp.cnstr_wd["signal_id"]) and list(cnstr_wd["par"]) == list(sp.cnstr_wd["par"]):
+                    sp.cnstr_wd["shift_allowed"] = cnstr_wd["shift_allowed"].values.astype(float)
+                    sp.cnstr_wd["relative"] = cnstr_wd["relative"].values.astype(bool)
+                else:
+                    sp.cnstr_wd = cnstr_wd
+            if record.get("fit_results", None) is not None and "opt" in params.columns:
+                params = params.astype({"opt": float, "opt_sd": float})
+                sp._set_fit_results(OptimizeResult(x=params["opt"].values, **record["fit_results"]), params["opt_sd"].values, 1.0)
+
+        return sp
+
+    def save_process_to_file(self, legacy=False):
+        """Save the process in the output folder, as a process folder ('<filename>.nmrfit', see store.ProcessStore).
+
+        Args:
+            legacy (bool, optional): save the process as a pickle file ('<filename>.pkl') instead. Defaults to False.
+
+        Returns:
+            Path: path to the process folder (or file)
+        """
 
         output_path = Path(self.output_res_path, self.output_res_folder)
+        Path(output_path).mkdir(parents=True, exist_ok=True)
+
+        if not legacy:
+            try:
+                return store.ProcessStore(Path(output_path, self.filename + ".nmrfit")).save(self)
+            except Exception as e:
+                raise ValueError(f"An unknown error has occured when saving the process file: {e}")
+
         output_file_tmp = Path(output_path, self.filename + "_tmp.pkl")
         output_file = Path(output_path, self.filename + ".pkl")
 
-        Path(output_path).mkdir(parents=True, exist_ok=True)
-
         try:
             with open(output_file_tmp, 'wb') as file:
                 pickle.dump(self, file)
@@ -478,37 +1284,147 @@ class Process(object):
         except Exception as e:
             raise ValueError(f"An unknown error has occured when saving the process file: {e}")
 
+        return output_file
+
+    @staticmethod
+    def load_process_from_file(path):
+        """Load a process saved with save_process_to_file().
+
+        Args:
+            path (str | Path): path to the process folder ('<filename>.nmrfit') or to the pickle file ('<filename>.pkl').
+
+        Returns:
+            Process: process
+        """
+
+        if store.ProcessStore.is_store(path):
+            process = Process.__new__(Process)
+            process.io = io.IoHandler()
+            return store.ProcessStore(path).load(process)
+
+        with open(path, 'rb') as file:
+            return pickle.load(file)
+
     def consolidate_results(self):
-        consolidated_results = []
-        for spec in self.results.keys():
-            for reg in self.results[spec].keys():
-                if 'opt' in self.results[spec][reg].params.columns:
-                    # add all params except integral
-                    for i in range(len(self.results[spec][reg].params)):
-                        tmp = [spec, reg]
-                        if self.results[spec][reg].params.iloc[i].loc['signal_id'] == "full_spectrum":
-                            tmp += [reg, None]
-                        else:
-                            tmp += [self.results[spec][reg].params.iloc[i].loc['signal_id'], self.results[spec][reg].params.iloc[i].loc['model']]
-                        tmp += [self.results[spec][reg].params.iloc[i].loc['par'],
-                                self.results[spec][reg].params.iloc[i].loc['opt'],
-                                self.results[spec][reg].params.iloc[i].loc['opt_sd']]
-                        consolidated_results.append(tmp)
-                    # add integral
-                    df_integral = self.results[spec][reg].params.loc[:, ['signal_id', 'model', 'integral']].drop_duplicates()
-                    for i in range(len(df_integral)):
-                        tmp = [spec, reg, df_integral.signal_id.iloc[i], df_integral.model.iloc[i], 'integral', df_integral.integral.iloc[i], None]
-                        consolidated_results.append(tmp)
-                # add integral of full spectrum
-                integral = self.results[spec][reg].integrate_full_spectrum()
-                tmp = [spec, reg, reg, None, 'region_integral', integral, None]
-                consolidated_results.append(tmp)
-
-        self.consolidated_results = pd.DataFrame(consolidated_results, columns=['rowno', 'region', 'signal_id', 'model', 'par', 'opt', 'opt_sd'])
-        self.consolidated_results.sort_values(by=['rowno'], inplace=True)
+        """Gather parameters and integrals of all fitted spectra in a single table (Process.consolidated_results).
+
+        The results of each spectrum are extracted from its parameters table at once, and kept until the spectrum is
+        fitted again, so only spectra fitted (or added) since the last consolidation are processed. Spectra loaded from
+        a processing folder are consolidated from their records, without being rebuilt.
+        """
+
+        previous = getattr(self, "_consolidated_blocks", {})
+        self._consolidated_blocks = {}
+        index = None
+        updated = False
+
+        for rowno in sorted(self.results.keys()):
+            regions = self.results[rowno]
+            for region in regions.keys():
+                record = regions.record(region) if isinstance(regions, store.LazyRegions) else None
+                if record is None:
+                    sp = regions[region]
+                    # a spectrum is consolidated again only if it has been replaced or fitted again
+                    key = (sp, sp.fit_results)
+                else:
+                    key = (record, None)
+                block = previous.get((rowno, region), None)
+                if block is None or block[0] is not key[0] or block[1] is not key[1]:
+                    if record is None:
+                        # columns are extracted at once (much faster than column by column)
+                        params = dict(zip(sp.params.columns, sp.params.to_numpy(dtype=object).T)) if 'opt' in sp.params.columns else None
+                        region_integral = sp.integrate_full_spectrum()
+                    else:
+                        params = record["params"] if record["params"] is not None and "opt" in record["params"] else None
+                        index = {name: i for i, name in enumerate(self.names)} if index is None else index
+                        region_integral = self._region_integral(index[rowno], record["window"])
+                    block = key + (self._consolidated_block(rowno, region, params, region_integral),)
+                    updated = True
+                self._consolidated_blocks[(rowno, region)] = block
+
+        # nothing has changed since the last consolidation
+        if not updated and self.consolidated_results is not None and list(previous.keys()) == list(self._consolidated_blocks.keys()):
+            return
+
+        columns = ['rowno', 'region', 'signal_id', 'model', 'par', 'opt', 'opt_sd']
+        blocks = [block[2] for block in self._consolidated_blocks.values()]
+        self.consolidated_results = pd.DataFrame({k: [v for block in blocks for v in block[k]] for k in columns}, columns=columns)
+
+    @staticmethod
+    def _consolidated_block(rowno, region, params, region_integral) -> dict:
+        """Build the consolidated results of a spectrum.
+
+        Args:
+            rowno (int): rowno of the spectrum.
+            region (str): region.
+            params (dict): parameters (columns of Spectrum.params), None if the spectrum has not been fitted.
+            region_integral (float): integral of the region.
+
+        Returns:
+            dict: consolidated results, as columns (lists)
+        """
+
+        signal_id, model, par, opt, opt_sd = [], [], [], [], []
+
+        if params is not None:
+            # all parameters (the offset is assigned to the region)
+            sid = list(params["signal_id"])
+            signal_id += [region if s == "full_spectrum" else s for s in sid]
+            model += [None if s == "full_spectrum" else m for s, m in zip(sid, params["model"])]
+            par += list(params["par"])
+            opt += [float(v) for v in params["opt"]]
+            opt_sd += [float(v) for v in params["opt_sd"]]
+
+            # integral of each signal
+            integrals = {}
+            for s, m, v in zip(sid, params["model"], params["integral"]):
+                integrals.setdefault((s, None if m is None or m != m else m, None if v is None or v != v else v), (s, m, v))
+            for s, m, v in integrals.values():
+                signal_id.append(s)
+                model.append(m)
+                par.append('integral')
+                opt.append(float(v))
+                opt_sd.append(np.nan)
+
+        # integral of the region
+        signal_id.append(region)
+        model.append(None)
+        par.append('region_integral')
+        opt.append(float(region_integral))
+        opt_sd.append(np.nan)
+
+        return {"rowno": [rowno] * len(signal_id),
+                "region": [region] * len(signal_id),
+                "signal_id": signal_id,
+                "model": model,
+                "par": par,
+                "opt": opt,
+                "opt_sd": opt_sd}
+
+    def _region_integral(self, i, window) -> float:
+        """Integrate a region of a row, without building the corresponding spectrum.
+
+        Args:
+            i (int): index of the row.
+            window (tuple): lower and upper bounds of the region (in ppm).
+
+        Returns:
+            float: integral of the region
+        """
+
+        if getattr(self, "_monotonic_ppm", None) is None:
+            self._monotonic_ppm = all(io.IoHandler.is_monotonic(axis) for axis in self.ppm_axes)
+
+        if not self._monotonic_ppm:
+            return self._create_spectrum(self.names[i], window).integrate_full_spectrum()
+
+        ppm = self.ppm_axes[0 if self.ppm_axes.shape[0] == 1 else i]
+        window_slice = io.IoHandler.window_slice(ppm, window)
+
+        return np.trapezoid(y=np.asarray(self.data_full[i][window_slice], dtype=float), x=np.asarray(ppm[window_slice], dtype=float))
 
     def get_current_intensity(self, ppm):
-        idx = min(range(len(self.current_spectrum.ppm)), key=lambda i: abs(self.current_spectrum.ppm[i]-ppm))
+        idx = np.argmin(np.abs(self.current_spectrum.ppm - ppm))
         return self.current_spectrum.intensity[idx]
 
     def select_params(self, signal, parameter):
@@ -2,16 +2,19 @@
 multinmrfit spectrum module
 """
 
+import copy
 import logging
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import pandas as pd
 import nmrglue as ng
-from scipy.optimize import minimize, differential_evolution
+from scipy.optimize import minimize, differential_evolution, least_squares, lsq_linear, OptimizeResult
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 #from functools import reduce
 
 import multinmrfit.base.io as io
+from multinmrfit.base.compiled_model import CompiledModel
 
 
 # create logger
@@ -21,6 +24,10 @@ logger = logging.getLogger(__name__)
 # this code maintains compatibility
 np.trapezoid = getattr(np, "trapezoid", np.trapz)
 
+# empty parameters & constraints windows tables (copying them is much faster than building new dataframes)
+EMPTY_PARAMS = pd.DataFrame(columns=['signal_id', 'model', 'par', 'ini', 'lb', 'ub'])
+EMPTY_CNSTR_WD = pd.DataFrame(columns=['signal_id', 'model', 'par', 'shift_allowed', 'relative'])
+
 
 class Spectrum(object):
     """This class is responsible for most of multinmrfit heavy work:
@@ -34,13 +41,14 @@ class Spectrum(object):
         * plotting
     """
 
-    def __init__(self, data, window: tuple = None, from_ref: int = None, rowno: int = None) -> None:
+    def __init__(self, data, window: tuple = None, from_ref: int = None, rowno: int = None, dtype=np.float64) -> None:
         """Construct the Spectrum object.
 
         Args:
             data (dataframe | dict): input data, either a dataframe containing the chemical shifts (with columns 'ppm' and 
                                      'intensity'), or a dict to load the data from Topspin files.
             window (tuple, optional): lower and upper bounds of the window of interest (in ppm) or full spectrum if None. Defaults to None.
+            dtype (np.dtype, optional): data type of chemical shifts and intensities (e.g. np.float32 to reduce memory usage). Defaults to np.float64.
         """
 
         logger.debug("create Spectrum object")
@@ -49,6 +57,51 @@ class Spectrum(object):
         loader = io.IoHandler()
         dataset = loader.load_data(data, window=window, rowno=rowno)
 
+        self._set_data(dataset, from_ref, dtype=dtype)
+
+    @classmethod
+    def from_arrays(cls, ppm: np.ndarray, intensity: np.ndarray, window: tuple = None, from_ref: int = None, rowno: int = None, dtype=np.float64):
+        """Construct the Spectrum object from the chemical shift and intensity of a full spectrum (e.g. a row of a
+        pseudo 2D spectrum). The window of interest is extracted by binary search, so the chemical shift axis must be monotonic.
+
+        Args:
+            ppm (np.ndarray): chemical shift (monotonic).
+            intensity (np.ndarray): intensity.
+            window (tuple, optional): lower and upper bounds of the window of interest (in ppm) or full spectrum if None. Defaults to None.
+            from_ref (int, optional): rowno of the spectrum used as reference. Defaults to None.
+            rowno (int, optional): rowno of the spectrum. Defaults to None.
+            dtype (np.dtype, optional): data type of chemical shifts and intensities. Defaults to np.float64.
+
+        Returns:
+            Spectrum: spectrum
+        """
+
+        logger.debug("create Spectrum object from arrays")
+
+        window_slice = io.IoHandler.window_slice(ppm, window)
+        dataset = {"data_path": None,
+                   "dataset": None,
+                   "expno": None,
+                   "procno": None,
+                   "rowno": rowno,
+                   "window": window,
+                   "ppm": ppm[window_slice],
+                   "intensity": intensity[window_slice]}
+
+        sp = cls.__new__(cls)
+        sp._set_data(dataset, from_ref, dtype=dtype)
+
+        return sp
+
+    def _set_data(self, dataset: dict, from_ref: int = None, dtype=np.float64) -> None:
+        """Set spectrum-related attributes, and initialize model-related attributes.
+
+        Args:
+            dataset (dict): data & metadata, as returned by IoHandler.load_data().
+            from_ref (int, optional): rowno of the spectrum used as reference. Defaults to None.
+            dtype (np.dtype, optional): data type of chemical shifts and intensities. Defaults to np.float64.
+        """
+
         # set spectrum-related attributes
         self.data_path = dataset["data_path"]
         self.dataset = dataset["dataset"]
@@ -56,10 +109,14 @@ class Spectrum(object):
         self.procno = dataset["procno"]
         self.rowno = dataset["rowno"]
         self.window = dataset["window"]
-        self.ppm = dataset["ppm"]
-        self.ppm_limits = (min(self.ppm), max(self.ppm))
+        # chemical shifts & intensities are stored as contiguous arrays (owning their data) to speed up simulations
+        self.ppm = np.array(dataset["ppm"], dtype=dtype)
+        self.ppm_limits = (float(np.min(self.ppm)), float(np.max(self.ppm))) if len(self.ppm) else (np.nan, np.nan)
         self.region = str(round(self.ppm_limits[0], 3)) + " | " + str(round(self.ppm_limits[1], 3))
-        self.intensity = dataset["intensity"]
+        self.intensity = np.array(dataset["intensity"], dtype=dtype)
+        # data are never modified, and can thus be shared by snapshots of the spectrum
+        self.ppm.flags.writeable = False
+        self.intensity.flags.writeable = False
         self.peakpicking_threshold = None
         self.from_ref = from_ref
         self.edited_peak_table = None
@@ -70,15 +127,76 @@ class Spectrum(object):
         # initialize model-related attributes (models, params, offset and fit_results) at default values
         self._set_default_model_attributes()
 
+    def __setstate__(self, state):
+        # spectra saved by previous versions store chemical shifts and intensities as pandas series
+        for k in ["ppm", "intensity"]:
+            if isinstance(state.get(k, None), pd.Series):
+                state[k] = np.array(state[k].values, dtype=float)
+        self.__dict__.update(state)
+
+    @property
+    def data(self) -> pd.DataFrame:
+        """Chemical shifts and intensities, as a dataframe (with columns 'ppm' and 'intensity')."""
+        return pd.DataFrame({"ppm": self.ppm, "intensity": self.intensity})
+
+    def snapshot(self):
+        """Copy the spectrum. Data (chemical shifts & intensities), compiled model, signals, peak tables and arrays
+        of fit results are shared with the original spectrum (they are never modified in place), parameters and
+        constraints windows are copied, and models are copied only when their parameters are modified.
+
+        Returns:
+            Spectrum: copy of the spectrum
+        """
+
+        sp = self.__class__.__new__(self.__class__)
+        sp.__dict__.update(self.__dict__)
+
+        # models are shared until they are modified (see _writable_model())
+        sp.models = dict(self.models)
+        self._shared_models = set(self.models)
+        sp._shared_models = set(self.models)
+
+        # copy mutable attributes
+        sp.params = self.params.copy()
+        sp.cnstr_wd = self.cnstr_wd.copy()
+        if self.user_models is not None:
+            sp.user_models = dict(self.user_models)
+        if self.fit_results is not None:
+            sp.fit_results = copy.copy(self.fit_results)
+
+        return sp
+
+    def _writable_model(self, id: str):
+        """Get the model of a signal to modify it, the model being copied first if it is shared with a snapshot.
+
+        Args:
+            id (str): signal id
+
+        Returns:
+            Model: model of the signal
+        """
+
+        shared = getattr(self, "_shared_models", set())
+        if id in shared:
+            model = copy.copy(self.models[id])
+            model._params = model._params.copy()
+            model._cnstr_wd = model._cnstr_wd.copy()
+            self.models[id] = model
+            shared.discard(id)
+
+        return self.models[id]
+
     def _set_default_model_attributes(self):
         """Initialize model-related attributes at default values.
         """
 
         self.models = {}
-        self.params = pd.DataFrame(columns=['signal_id', 'model', 'par', 'ini', 'lb', 'ub'])
-        self.cnstr_wd = pd.DataFrame(columns=['signal_id', 'model', 'par', 'shift_allowed', 'relative'])
+        self._shared_models = set()
+        self.params = EMPTY_PARAMS.copy()
+        self.cnstr_wd = EMPTY_CNSTR_WD.copy()
         self.offset = False
         self.fit_results = None
+        self._compiled_model = None
 
     def _initialize_models(self, signals: dict, available_models: dict) -> None:
         """Initialize models of each signal.
@@ -108,19 +226,19 @@ class Spectrum(object):
             # add global parameters indices to model object
             self.models[id]._par_idx = [i for i in range(len(self.params), len(_params.index)+len(self.params))]
 
-            # add model parameters to global parameters
-            self.params = _params if self.params.empty else pd.concat([self.params, _params])
+            # add model parameters to global parameters (copied, so they are not shared with the model)
+            self.params = _params.copy() if self.params.empty else pd.concat([self.params, _params])
 
             # add constraints windows
             _cnstr_wd = self.models[id].set_default_cnstr_wd()
             _cnstr_wd.insert(0, 'signal_id', [id]*len(_cnstr_wd.index))
-            self.cnstr_wd = _cnstr_wd if self.cnstr_wd.empty else pd.concat([self.cnstr_wd, _cnstr_wd])
+            self.cnstr_wd = _cnstr_wd.copy() if self.cnstr_wd.empty else pd.concat([self.cnstr_wd, _cnstr_wd])
 
         # reset index
         self.params.reset_index(inplace=True, drop=True)
         self.cnstr_wd.reset_index(inplace=True, drop=True)
 
-        logger.debug("parameters\n{}".format(self.params))
+        logger.debug("parameters\n%s", self.params)
 
     def _reset_fit_results(self) -> None:
         """Remove results of the last fit.
@@ -144,71 +262,166 @@ class Spectrum(object):
         """
 
         # update parameter in model
-        self.models[id].set_params(par, (k, v))
+        self._writable_model(id).set_params(par, (k, v))
 
         # update self.params
         self.params.loc[(self.params["signal_id"] == id) & (self.params["par"] == par), k] = v
 
+    def _restore_params(self, params: pd.DataFrame) -> None:
+        """Set initial values and bounds of all parameters at once (e.g. when the spectrum is restored from a file).
+
+        Args:
+            params (pd.DataFrame): parameters, with same format (and same order) as Spectrum.params.
+        """
+
+        # check the model has been built
+        self._check_model()
+
+        # reset results of previous fit
+        self._reset_fit_results()
+
+        if list(params["signal_id"]) != list(self.params["signal_id"]) or list(params["par"]) != list(self.params["par"]):
+            raise ValueError("parameters do not match the model of the spectrum.")
+
+        # update parameters in spectrum and in models
+        for k in ["ini", "lb", "ub"]:
+            values = np.asarray(params[k], dtype=float)
+            self.params[k] = values
+            for id in self.models:
+                model = self._writable_model(id)
+                model._params[k] = values[model._par_idx]
+
+    def _compile_model(self) -> None:
+        """Build the compiled model used to simulate the spectrum from the global parameters vector.
+        """
+
+        self._compiled_model = CompiledModel(self.models, n_params=len(self.params), offset=self.offset)
+
+    def _get_compiled_model(self) -> CompiledModel:
+        """Get the compiled model, and build it if needed (e.g. for spectra loaded from older process files).
+
+        Returns:
+            CompiledModel: compiled model
+        """
+
+        if getattr(self, "_compiled_model", None) is None:
+            self._compile_model()
+
+        return self._compiled_model
+
     @staticmethod
-    def _simulate(params: list, ppm: list, models: dict, offset: bool = False) -> list:
-        """Simulate spectrum
+    def _calculate_cost(params: list, func: callable, ppm: list, intensity: list) -> float:
+        """Calculate residuum as sum of squared differences between experimental and simulated data.
 
         Args:
             params (list): parameters values
+            func (function): simulation function
             ppm (list): chemical shifts
-            models (dict): models of all signals
-            offset (bool, optional): offset (provided as last element of params) added to spectrum if True. Defaults to False.
+            intensity (list): measured intensities
 
         Returns:
-            list: simulated intensities
+            float: residuum
         """
 
-        # initialize spectrum at offset or 0
-        if offset:
-            simulated_spectrum = np.empty(len(ppm))
-            simulated_spectrum.fill(params[-1])
-        else:
-            simulated_spectrum = np.zeros(len(ppm))
+        # simulate spectrum
+        simulated_spectrum = func(params, ppm)
 
-        # add subspectrum of each signal
-        for model in models.values():
-            simulated_spectrum += model.simulate([params[i] for i in model._par_idx], ppm)
+        # calculate sum of squared residuals
+        residuum = np.sum(np.square(simulated_spectrum - intensity))
 
-        # ALTERNATIVE SIMULATION METHOD
-        # (same timing as the implemented method, just keep it here because it might be usefull somehow in the future)
+        return residuum
 
-        # simulate individual signals and add them together
-        #simulated_spectrum = reduce(np.add, [model.simulate([params[i] for i in model._par_idx], ppm)  for model in models.values()])
+    @staticmethod
+    def _calculate_cost_batch(params: np.ndarray, func: callable, ppm: list, intensity: list, executor: ThreadPoolExecutor = None,
+                              workers: int = 1) -> np.ndarray:
+        """Calculate residuum (as sum of squared differences between experimental and simulated data) for a set of parameters vectors.
 
-        # add offset if required
-        #if offset:
-        #    simulated_spectrum += params[-1]
+        Args:
+            params (np.ndarray): parameters values, with shape (n_params, n_vectors)
+            func (function): simulation function, which accepts parameters with shape (n_vectors, n_params)
+            ppm (list): chemical shifts
+            intensity (list): measured intensities
+            executor (ThreadPoolExecutor, optional): executor used to evaluate subsets of parameters vectors in parallel. Defaults to None.
+            workers (int, optional): number of workers of the executor, i.e. number of subsets of parameters vectors. Defaults to 1.
 
-        return simulated_spectrum
+        Returns:
+            np.ndarray: residuum of each parameters vector
+        """
+
+        intensity = np.asarray(intensity, dtype=float)
+
+        def cost(p):
+            return np.sum(np.square(func(p, ppm) - intensity), axis=1)
+
+        if executor is None:
+            return cost(params.T)
+
+        chunks = np.array_split(params.T, workers)
+        residuum = np.concatenate(list(executor.map(cost, chunks)))
+
+        return residuum
 
     @staticmethod
-    def _calculate_cost(params: list, func: callable, models: dict, ppm: list, intensity: list, offset: bool = False) -> float:
-        """Calculate residuum as sum of squared differences between experimental and simulated data.
+    def _calculate_cost_and_gradient(params: list, func: callable, jac: callable, ppm: list, intensity: list) -> tuple:
+        """Calculate residuum (as sum of squared differences between experimental and simulated data) and its gradient.
 
         Args:
             params (list): parameters values
             func (function): simulation function
-            models (dict): models of all signals
+            jac (function): function returning the partial derivatives of the simulated spectrum
             ppm (list): chemical shifts
             intensity (list): measured intensities
-            offset (bool, optional): offset (provided as last element of params) added to spectrum if True. Defaults to False.
 
         Returns:
             float: residuum
+            np.ndarray: gradient of the residuum with respect to each parameter
         """
 
-        # simulate spectrum
-        simulated_spectrum = func(params, ppm, models, offset=offset)
+        # calculate residuals
+        residuals = np.asarray(func(params, ppm) - intensity, dtype=float)
 
         # calculate sum of squared residuals
-        residuum = np.sum(np.square(simulated_spectrum - intensity))
+        residuum = np.sum(np.square(residuals))
 
-        return residuum
+        # calculate gradient from the jacobian of the simulated spectrum
+        gradient = 2 * (jac(params, ppm).T @ residuals)
+
+        return residuum, gradient
+
+    @staticmethod
+    def _calculate_residuals(params: list, func: callable, ppm: list, intensity: list) -> np.ndarray:
+        """Calculate residuals as differences between simulated and experimental data.
+
+        Args:
+            params (list): parameters values
+            func (function): simulation function
+            ppm (list): chemical shifts
+            intensity (list): measured intensities
+
+        Returns:
+            np.ndarray: residuals
+        """
+
+        return np.asarray(func(params, ppm) - intensity, dtype=float)
+
+    @staticmethod
+    def _strict_bounds(lb: list, ub: list) -> tuple:
+        """Get bounds suitable for solvers requiring lower bounds strictly lower than upper bounds
+        (parameters with equal bounds are kept fixed up to the floating point precision).
+
+        Args:
+            lb (list): lower bounds
+            ub (list): upper bounds
+
+        Returns:
+            tuple: lower and upper bounds
+        """
+
+        lb = np.asarray(lb, dtype=float)
+        ub = np.asarray(ub, dtype=float)
+        ub = np.where(ub > lb, ub, np.nextafter(lb, np.inf))
+
+        return lb, ub
 
     def _check_parameters(self) -> None:
         """
@@ -230,6 +443,9 @@ class Spectrum(object):
     def _linear_stats(res, ftol: float = 2.220446049250313e-09) -> list:
         """Calculate standard deviation on estimated parameters using linear statistics.
 
+        Standard deviations are calculated from the jacobian at the optimum for least-squares fits, and
+        from the inverse hessian approximation otherwise.
+
         Args:
             res (scipy.optimize.OptimizeResult): fit results
             ftol (float, optional): ftol of optimization. Defaults to 2.220446049250313e-09.
@@ -239,6 +455,15 @@ class Spectrum(object):
         """
 
         npar = len(res.x)
+
+        if np.ndim(res.get("jac", None)) == 2:
+            # covariance matrix estimated from the jacobian of residuals
+            dof = max(1, len(res.fun) - npar)
+            variance = np.sum(np.square(res.fun)) / dof
+            covariance = np.linalg.pinv(res.jac.T @ res.jac) * variance
+            standard_deviations = np.sqrt(np.abs(np.diag(covariance)))
+            return standard_deviations
+
         tmp_i = np.zeros(npar)
         standard_deviations = np.array([np.inf]*npar)
 
@@ -265,6 +490,97 @@ class Spectrum(object):
         if self.fit_results is None:
             raise ValueError("Spectrum has not been fitted, must call fit() first.")
 
+    def _linear_params(self) -> np.ndarray:
+        """Identify parameters which enter the simulated spectrum linearly, i.e. the offset and the intensities of
+        signals described by their multiplet structure.
+
+        Returns:
+            np.ndarray: mask of linear parameters
+        """
+
+        linear = (self.params['par'] == "offset").values.copy()
+        for model in self.models.values():
+            if getattr(model, "multiplet", None) is not None:
+                linear[model._par_idx[list(model.default_params['par']).index('intensity')]] = True
+
+        return linear
+
+    def _fit_variable_projection(self, compiled_model: CompiledModel, x0: list, lb: list, ub: list, intensity: list) -> OptimizeResult:
+        """Fit spectrum by variable projection: the optimizer only sees the nonlinear parameters, and the linear ones
+        (intensities and offset) are estimated by bounded linear least squares at each evaluation.
+
+        Args:
+            compiled_model (CompiledModel): compiled model
+            x0 (list): initial values of parameters
+            lb (list): lower bounds of parameters
+            ub (list): upper bounds of parameters
+            intensity (list): measured intensities
+
+        Returns:
+            scipy.optimize.OptimizeResult: optimization results, with all (linear and nonlinear) parameters.
+        """
+
+        ppm = np.asarray(self.ppm, dtype=float)
+        intensity = np.asarray(intensity, dtype=float)
+        lb, ub = self._strict_bounds(lb, ub)
+        linear = self._linear_params()
+        nonlinear = ~linear
+
+        # derivatives with respect to nonlinear parameters of a signal are proportional to its intensity
+        intensity_idx = np.full(len(linear), -1)
+        for model in self.models.values():
+            if getattr(model, "multiplet", None) is not None:
+                intensity_idx[model._par_idx] = model._par_idx[list(model.default_params['par']).index('intensity')]
+        owner = intensity_idx[nonlinear]
+        has_owner = owner >= 0
+
+        x = np.asarray(x0, dtype=float).copy()
+        cache = {}
+
+        def evaluate(theta):
+            key = theta.tobytes()
+            if key not in cache:
+                cache.clear()
+                # spectrum without linear contributions, and basis of linear contributions (at unit intensities)
+                x[nonlinear] = theta
+                x[linear] = 0.0
+                baseline = compiled_model.simulate(x, ppm)
+                x[linear] = 1.0
+                jacobian = compiled_model.jacobian(x, ppm)
+                basis = jacobian[:, linear]
+                # estimate linear parameters
+                target = intensity - baseline
+                coef = np.linalg.lstsq(basis, target, rcond=None)[0]
+                if np.any(coef < lb[linear]) or np.any(coef > ub[linear]):
+                    coef = lsq_linear(basis, target, bounds=(lb[linear], ub[linear]), method="bvls").x
+                x[linear] = coef
+                residuals = basis @ coef + baseline - intensity
+                # derivatives with respect to nonlinear parameters at estimated intensities, projected on the
+                # orthogonal complement of the basis (Kaufman approximation)
+                jac_nl = jacobian[:, nonlinear]
+                jac_nl[:, has_owner] *= x[owner[has_owner]]
+                q, _ = np.linalg.qr(basis)
+                jac_nl -= q @ (q.T @ jac_nl)
+                cache[key] = (residuals, jac_nl, x.copy())
+            return cache[key]
+
+        res = least_squares(
+            lambda theta: evaluate(theta)[0],
+            x0=x[nonlinear],
+            jac=lambda theta: evaluate(theta)[1],
+            bounds=(lb[nonlinear], ub[nonlinear]),
+            method="trf",
+            x_scale="jac"
+        )
+
+        # gather linear and nonlinear parameters
+        residuals, _, x_opt = evaluate(res.x)
+        res.x = x_opt
+        res.fun = residuals
+        res.jac = compiled_model.jacobian(x_opt, ppm)
+
+        return res
+
     def peak_picking(self, threshold: int) -> pd.DataFrame:
         """Peak picking.
 
@@ -313,7 +629,7 @@ class Spectrum(object):
 
         peak_table.drop('X_LW', axis=1, inplace=True)
 
-        logger.debug("peak table\n{}".format(peak_table))
+        logger.debug("peak table\n%s", peak_table)
 
         return peak_table
 
@@ -338,6 +654,9 @@ class Spectrum(object):
         # set offset
         self.update_offset(offset)
 
+        # compile model
+        self._compile_model()
+
     def update_params(self, signals: dict) -> None:
         """Update parameters (initial values, lower and upper bounds).
 
@@ -404,6 +723,11 @@ class Spectrum(object):
             else:
                 raise TypeError("offset must be a dict or None")
 
+        # update compiled model if the parameters vector has changed
+        compiled_model = getattr(self, "_compiled_model", None)
+        if compiled_model is not None and (compiled_model.offset != self.offset or compiled_model.n_params != len(self.params)):
+            self._compile_model()
+
     def simulate(self, params: list = None) -> list:
         """Simulate spectrum.
 
@@ -421,16 +745,19 @@ class Spectrum(object):
             params = self.params['ini'].values.tolist()
 
         # simulate spectrum
-        simulated_spectra = self._simulate(params, self.ppm, self.models, offset=self.offset)
+        simulated_spectra = self._get_compiled_model().simulate(params, self.ppm)
 
         return simulated_spectra
 
     def integrate(self, params: list = None, bounds: list = [-100.0, 300.0]) -> dict:
         """Integrate each signal of the spectrum.
 
+        Signals are integrated analytically when their model describes its multiplet structure, and numerically
+        within bounds otherwise.
+
         Args:
             params (list, optional): parameters values, initial values if None. Defaults to None.
-            bounds (list, optional): bounds for integration. Defaults to [-100.0, 300.0].
+            bounds (list, optional): bounds for numerical integration. Defaults to [-100.0, 300.0].
 
         Returns:
             dict: area of each signal.
@@ -442,19 +769,25 @@ class Spectrum(object):
         if params is None:
             params = self.params['ini'].values.tolist()
 
-        # simulate spectrum
-        from_to = np.arange(bounds[0], bounds[1], (bounds[1] - bounds[0])/4000000.0)
+        # integrate each signal (analytically if possible, numerically otherwise)
+        from_to = None
         area = {}
         for name, model in self.models.items():
+            if getattr(model, "multiplet", None) is None and from_to is None:
+                from_to = np.arange(bounds[0], bounds[1], (bounds[1] - bounds[0])/4000000.0)
             area[name] = model.integrate([params[i] for i in model._par_idx], from_to)
 
         return area
 
-    def fit(self, method: str = "L-BFGS-B"):
+    def fit(self, method: str = "L-BFGS-B", workers: int = 1):
         """Fit spectrum.
 
         Args:
-            method (str, optional): optimization method, "L-BFGS-B" or "differential_evolution". Defaults to "L-BFGS-B".
+            method (str, optional): optimization method, "L-BFGS-B", "least_squares" (trust region reflective algorithm
+                                    applied to the vector of residuals), "variable_projection" (same as "least_squares", with
+                                    intensities and offset estimated by linear least squares) or "differential_evolution".
+                                    Defaults to "L-BFGS-B".
+            workers (int, optional): number of threads used to evaluate the population of differential evolution. Defaults to 1.
 
         Returns:
             scipy.optimize.OptimizeResult: optimization results.
@@ -482,26 +815,39 @@ class Spectrum(object):
         # set bounds
         bounds = list(zip(params_scaled['lb'], params_scaled['ub']))
 
-        # scale data
-        data_scaled = self.intensity / scaling_factor
+        # scale data (computations are always performed in double precision)
+        ppm = self.ppm.astype(np.float64, copy=False)
+        data_scaled = self.intensity.astype(np.float64) / scaling_factor
+
+        # get compiled model
+        compiled_model = self._get_compiled_model()
 
         # fit spectrum
         if method == "differential_evolution":
 
-            initial_approximation = differential_evolution(
-                Spectrum._calculate_cost,
-                maxiter=700,
-                popsize=10,
-                bounds=bounds,
-                args=(self._simulate, self.models, self.ppm, data_scaled, self.offset),
-                polish=False,
-                x0=x0
-            )
+            # evaluate the whole population at once (in parallel if several workers are used)
+            executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+            try:
+                initial_approximation = differential_evolution(
+                    Spectrum._calculate_cost_batch,
+                    maxiter=700,
+                    popsize=10,
+                    bounds=bounds,
+                    args=(compiled_model.simulate, ppm, data_scaled, executor, workers),
+                    polish=False,
+                    x0=x0,
+                    vectorized=True,
+                    updating="deferred"
+                )
+            finally:
+                if executor is not None:
+                    executor.shutdown()
             self.fit_results = minimize(
-                Spectrum._calculate_cost,
+                Spectrum._calculate_cost_and_gradient,
                 x0=initial_approximation.x,
-                args=(self._simulate, self.models, self.ppm, data_scaled, self.offset),
+                args=(compiled_model.simulate, compiled_model.jacobian, ppm, data_scaled),
                 method="L-BFGS-B",
+                jac=True,
                 bounds=bounds,
                 options={'maxcor': 40, 'maxls': 40}
             )
@@ -510,14 +856,31 @@ class Spectrum(object):
         elif method == "L-BFGS-B":
 
             self.fit_results = minimize(
-                Spectrum._calculate_cost,
+                Spectrum._calculate_cost_and_gradient,
                 x0=x0,
-                args=(self._simulate, self.models, self.ppm, data_scaled, self.offset),
+                args=(compiled_model.simulate, compiled_model.jacobian, ppm, data_scaled),
                 method="L-BFGS-B",
+                jac=True,
                 bounds=bounds,
                 options={'maxcor': 40, 'maxls': 40}
             )
 
+        elif method == "variable_projection":
+
+            self.fit_results = self._fit_variable_projection(compiled_model, x0, params_scaled['lb'], params_scaled['ub'], data_scaled)
+
+        elif method == "least_squares":
+
+            self.fit_results = least_squares(
+                Spectrum._calculate_residuals,
+                x0=x0,
+                jac=lambda x, *args: compiled_model.jacobian(x, ppm),
+                bounds=self._strict_bounds(params_scaled['lb'], params_scaled['ub']),
+                method="trf",
+                x_scale="jac",
+                args=(compiled_model.simulate, ppm, data_scaled)
+            )
+
         else:
 
             raise ValueError("optimization method '{}' not implemented".format(method))
@@ -525,6 +888,20 @@ class Spectrum(object):
         # calculate standard deviation on estimated parameters (linear statistics)
         standard_deviations = self._linear_stats(self.fit_results)
 
+        # save results
+        self._set_fit_results(self.fit_results, standard_deviations, scaling_factor)
+
+    def _set_fit_results(self, fit_results: OptimizeResult, standard_deviations: list, scaling_factor: float) -> None:
+        """Save fitting results (estimated parameters, standard deviations, best fit and integrals).
+
+        Args:
+            fit_results (scipy.optimize.OptimizeResult): optimization results, with scaled parameters.
+            standard_deviations (list): standard deviations on scaled parameters.
+            scaling_factor (float): scaling factor applied on intensities and offset.
+        """
+
+        self.fit_results = fit_results
+
         # add estimated parameters & sds
         self.params['opt'] = self.fit_results.x
         self.params['opt_sd'] = standard_deviations
@@ -536,11 +913,11 @@ class Spectrum(object):
         self.fit_results.best_fit = self.simulate(self.params['opt'].values.tolist())
 
         # integrate spectrum
-        delta = (max(self.ppm) - min(self.ppm))/2
-        integrals = self.integrate(self.params['opt'].values.tolist(), bounds=[min(self.ppm)-delta, max(self.ppm)+delta])
+        delta = (np.max(self.ppm) - np.min(self.ppm))/2
+        integrals = self.integrate(self.params['opt'].values.tolist(), bounds=[np.min(self.ppm)-delta, np.max(self.ppm)+delta])
         self.params['integral'] = [integrals[i] if i != 'full_spectrum' else np.nan for i in self.params['signal_id'].values]
 
-        logger.debug("parameters\n{}".format(self.params))
+        logger.debug("parameters\n%s", self.params)
 
     def integrate_full_spectrum(self) -> float:
         """Integrate full spectrum.
@@ -590,7 +967,7 @@ class Spectrum(object):
 
         if colored_area:
             for name, model in self.models.items():
-                model_intensity = model.simulate([self.params['opt'].values.tolist()[i] for i in model._par_idx], np.array(self.ppm.values.tolist()))
+                model_intensity = model.simulate([self.params['opt'].values.tolist()[i] for i in model._par_idx], self.ppm)
                 fig_colored_area = go.Scatter(
                     x=self.ppm,
                     y=model_intensity,
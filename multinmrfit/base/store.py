@@ -0,0 +1,538 @@
+"""
+multinmrfit store module, to save and load processes as structured (columnar) process folders
+"""
+
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import numpy as np
+
+
+# create logger
+logger = logging.getLogger(__name__)
+
+# version of the process folder layout
+STORE_VERSION = 1
+
+# attributes of the process saved as metadata
+PROCESS_ATTRIBUTES = ["analysis_type", "data_path", "dataset", "expno", "procno", "output_res_path", "output_res_folder", "filename"]
+
+# maximal number of data points read at once when writing raw data
+CHUNK_SIZE = 2**22
+
+# columns of the parameters tables
+PARAMS_COLUMNS = ["ini", "lb", "ub", "opt", "opt_sd", "integral"]
+
+
+def to_json(obj):
+    """Convert numpy objects to json serializable objects."""
+
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    return str(obj)
+
+
+def fit_statistics(fit_results) -> dict:
+    """Extract fit statistics (i.e. all scalar results) from optimization results.
+
+    Args:
+        fit_results (scipy.optimize.OptimizeResult): optimization results.
+
+    Returns:
+        dict: fit statistics, None if the spectrum has not been fitted
+    """
+
+    if fit_results is None:
+        return None
+
+    statistics = {k: fit_results[k] for k in ["success", "status", "message", "nfev", "nit", "cost"] if k in fit_results}
+    if np.ndim(fit_results.get("fun", None)) == 0:
+        statistics["fun"] = fit_results.get("fun", None)
+
+    return statistics
+
+
+class LazyRegions(dict):
+    """Spectra of a given row (by region) of a process loaded from a process folder. Spectra are stored as records
+    and rebuilt the first time they are accessed.
+    """
+
+    def __init__(self, records: dict, loader: callable) -> None:
+        """Construct the LazyRegions object.
+
+        Args:
+            records (dict): records of spectra, by region.
+            loader (callable): function which builds a spectrum from its record.
+        """
+
+        super().__init__(records)
+        self._loader = loader
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        if isinstance(value, dict):
+            value = self._loader(value)
+            super().__setitem__(key, value)
+        return value
+
+    def __iter__(self):
+        # required to prevent dict() and dict.update() from copying records
+        return iter(self.keys())
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def pop(self, key, *args):
+        if key in self:
+            value = self[key]
+            super().pop(key)
+            return value
+        return super().pop(key, *args)
+
+    def values(self):
+        return [self[k] for k in self.keys()]
+
+    def items(self):
+        return [(k, self[k]) for k in self.keys()]
+
+    def record(self, key) -> dict:
+        """Get the record of a spectrum which has not been rebuilt yet.
+
+        Args:
+            key (str): region.
+
+        Returns:
+            dict: record, None if the spectrum has already been rebuilt
+        """
+
+        value = super().__getitem__(key)
+        return value if isinstance(value, dict) else None
+
+    def __reduce__(self):
+        # saved (e.g. pickled or deep copied) as a standard dict of spectra
+        return (dict, (dict(self.items()),))
+
+
+class ProcessStore(object):
+    """This class saves and loads a process as a process folder, which contains:
+
+        * process.json: metadata of the process and of each spectrum (window, signals, fit statistics, etc)
+        * data_full.npy & ppm_full.npy: raw data (intensities and chemical shift axis, saved once if shared by all
+          rows), written once and memory-mapped when loaded
+        * tables/*.npz: parameters tables, one table for each group of spectra with the same parameters
+          (one row per spectrum, one column per parameter)
+
+    Spectra are rebuilt only when they are accessed, so large processes are loaded quickly. Saving is incremental:
+    tables are only written for spectra which have changed since the process was last saved (or loaded), in a new
+    generation of tables, and tables of previous generations are kept as long as they contain saved spectra.
+    """
+
+    def __init__(self, path) -> None:
+        """Construct the ProcessStore object.
+
+        Args:
+            path (str | Path): path to the process folder.
+        """
+
+        self.path = Path(path)
+
+    @staticmethod
+    def is_store(path) -> bool:
+        """Check if a path is a process folder.
+
+        Args:
+            path (str | Path): path.
+
+        Returns:
+            bool: True if path is a process folder
+        """
+
+        return Path(path, "process.json").is_file()
+
+    @staticmethod
+    def _file_stamp(data_file: Path) -> tuple:
+        """Get the size and modification time of a file, used to detect if it has been rewritten.
+
+        Args:
+            data_file (Path): path to the file.
+
+        Returns:
+            tuple: (size, modification time), None if the file is missing
+        """
+
+        if not data_file.is_file():
+            return None
+        stat = data_file.stat()
+        return (stat.st_size, stat.st_mtime_ns)
+
+    def _write_data(self, name: str, array: np.ndarray, previous: tuple = None) -> tuple:
+        """Write raw data, only if they are missing or have changed.
+
+        Args:
+            name (str): name of the array.
+            array (np.ndarray | io.Bruker2DData): data.
+            previous (tuple, optional): (data, file stamp) of the last save or load of the process, data are not compared
+                if the same data object is saved in the same (unmodified) file. Defaults to None.
+
+        Returns:
+            tuple: (data, file stamp) of the saved data
+        """
+
+        data_file = Path(self.path, name + ".npy")
+
+        # same data as the last save (or load), and file unchanged since then
+        if previous is not None and previous[0] is array and previous[1] is not None and self._file_stamp(data_file) == previous[1]:
+            return previous
+
+        # raw data loaded from this file
+        if isinstance(array, np.memmap) and array.filename is not None and Path(array.filename).resolve() == data_file.resolve():
+            return (array, self._file_stamp(data_file))
+
+        # data are compared and written by chunks of rows, so memory-mapped data are not fully loaded in memory
+        chunk_size = max(1, CHUNK_SIZE // max(1, array.shape[1]))
+        chunks = range(0, array.shape[0], chunk_size)
+
+        if data_file.is_file():
+            saved = np.load(data_file, mmap_mode="r")
+            is_same = saved.shape == array.shape and all(np.array_equal(saved[i:i+chunk_size], array[i:i+chunk_size]) for i in chunks)
+            del saved
+            if is_same:
+                return (array, self._file_stamp(data_file))
+
+        tmp_file = Path(self.path, name + "_tmp.npy")
+        saved = np.lib.format.open_memmap(tmp_file, mode="w+", dtype=array.dtype, shape=array.shape)
+        for i in chunks:
+            saved[i:i+chunk_size] = array[i:i+chunk_size]
+        saved.flush()
+        del saved
+        os.replace(tmp_file, data_file)
+
+        return (array, self._file_stamp(data_file))
+
+    @staticmethod
+    def _spectrum_record(sp) -> dict:
+        """Build the record of a spectrum (i.e. all attributes except raw data and parameters).
+
+        Args:
+            sp (Spectrum): spectrum.
+
+        Returns:
+            dict: record
+        """
+
+        record = {"rowno": sp.rowno,
+                  "region": sp.region,
+                  "ref": sp.from_ref,
+                  "window": sp.window,
+                  "signals": sp.signals,
+                  "offset": bool(sp.offset),
+                  "fit_results": fit_statistics(sp.fit_results),
+                  "peakpicking_threshold": sp.peakpicking_threshold,
+                  "user_models": sp.user_models}
+        for k in ["edited_peak_table", "_edited_peak_table"]:
+            table = getattr(sp, k, None)
+            record[k] = None if table is None else {"columns": list(table.columns), "data": table.astype(object).where(table.notna(), None).values.tolist()}
+
+        return record
+
+    def _build_tables(self, spectra: list) -> tuple:
+        """Group spectra with the same parameters, and build the parameters tables of each group.
+
+        Args:
+            spectra (list): spectra (spectra which have not been rebuilt since loading are provided as records).
+
+        Returns:
+            tuple: (tables metadata, tables columns, records of spectra)
+        """
+
+        groups, records = {}, []
+        for sp in spectra:
+            if isinstance(sp, dict):
+                record = dict(sp)
+                params, cnstr_wd = record.pop("params"), record.pop("cnstr_wd", None)
+            else:
+                record = self._spectrum_record(sp)
+                params = None if not len(sp.params) else {k: sp.params[k].values for k in sp.params.columns}
+                cnstr_wd = None if not len(sp.cnstr_wd) else {k: sp.cnstr_wd[k].values for k in sp.cnstr_wd.columns}
+            record.pop("table", None)
+            record.pop("row", None)
+            records.append(record)
+            if params is None:
+                continue
+
+            # group spectra by parameters
+            layout = (tuple(params["signal_id"]), tuple(None if m is None or m != m else m for m in params["model"]), tuple(params["par"]))
+            group = groups.setdefault(layout, {"spectra": [], "params": [], "cnstr_wd": []})
+            record["table"], record["row"] = list(groups.keys()).index(layout), len(group["spectra"])
+            group["spectra"].append(record)
+            group["params"].append(params)
+
+            # constraints windows are saved in the table if they match parameters
+            if cnstr_wd is not None and tuple(cnstr_wd["signal_id"]) == layout[0] and tuple(cnstr_wd["par"]) == layout[2]:
+                group["cnstr_wd"].append(cnstr_wd)
+            else:
+                group["cnstr_wd"].append(None)
+                record["cnstr_wd"] = None if cnstr_wd is None else {k: list(v) for k, v in cnstr_wd.items()}
+
+        # build columns of each table
+        tables, columns = [], []
+        for (signal_id, model, par), group in groups.items():
+            tables.append({"signal_id": list(signal_id), "model": list(model), "par": list(par)})
+            n_params = len(par)
+            table = {}
+            for k in PARAMS_COLUMNS:
+                if any(k in params for params in group["params"]):
+                    table[k] = np.array([np.asarray(params[k], dtype=float) if k in params else np.full(n_params, np.nan) for params in group["params"]],
+                                        dtype=float)
+            if all(cnstr_wd is not None for cnstr_wd in group["cnstr_wd"]):
+                table["shift_allowed"] = np.array([np.asarray(cnstr_wd["shift_allowed"], dtype=float) for cnstr_wd in group["cnstr_wd"]], dtype=float)
+                table["relative"] = np.array([np.asarray(cnstr_wd["relative"], dtype=bool) for cnstr_wd in group["cnstr_wd"]], dtype=bool)
+            else:
+                for record, cnstr_wd in zip(group["spectra"], group["cnstr_wd"]):
+                    if cnstr_wd is not None:
+                        record["cnstr_wd"] = {k: list(v) for k, v in cnstr_wd.items()}
+            # rows of the table where each column is defined
+            for k in PARAMS_COLUMNS:
+                if k in table:
+                    table["has_" + k] = np.array([k in params for params in group["params"]], dtype=bool)
+            columns.append(table)
+
+        return tables, columns, records
+
+    @staticmethod
+    def _marker(obj):
+        """Build the marker used to detect if a spectrum has changed since it was saved, i.e. a hash of its content
+        (parameters, constraints windows, fit statistics, signals, peak tables, etc), so that spectra modified in place
+        are detected.
+
+        Args:
+            obj (Spectrum | dict): spectrum, or record of a spectrum which has not been rebuilt since loading.
+
+        Returns:
+            bytes | dict: hash of the spectrum, or the record itself (unchanged as long as it is the same object)
+        """
+
+        if isinstance(obj, dict):
+            return obj
+
+        content = [obj.rowno, obj.region, obj.from_ref, obj.window, bool(obj.offset), obj.peakpicking_threshold, obj.user_models, obj.signals,
+                   fit_statistics(obj.fit_results)]
+        for table in [obj.params, obj.cnstr_wd, obj.edited_peak_table, obj._edited_peak_table]:
+            content.append(None if table is None else (list(table.columns), table.to_numpy(dtype=object).tolist()))
+
+        return hashlib.blake2b(repr(content).encode(), digest_size=16).digest()
+
+    @staticmethod
+    def _is_unchanged(marker, saved_marker) -> bool:
+        """Check if a spectrum is unchanged since it was saved.
+
+        Args:
+            marker (bytes | dict): current marker of the spectrum (see _marker()).
+            saved_marker (bytes | dict): marker of the spectrum when it was saved.
+
+        Returns:
+            bool: True if the spectrum is unchanged
+        """
+
+        return marker is saved_marker or (isinstance(marker, bytes) and marker == saved_marker)
+
+    def _registry(self, process, generation: int) -> tuple:
+        """Get the spectra saved in the process folder (by the last save or load of the process), as
+        {(rowno, region): (marker, record)}, and the saved raw data, as {name: (data, file stamp)}.
+
+        Args:
+            process (Process): process.
+            generation (int): current generation of the process folder.
+
+        Returns:
+            tuple: saved spectra and raw data, empty if the process folder has been written by another process
+        """
+
+        registry = getattr(process, "_store_registry", None)
+        if registry is None or registry[0] != self.path.resolve() or registry[1] != generation:
+            return {}, {}
+
+        return registry[2], registry[3]
+
+    def save(self, process) -> Path:
+        """Save a process. Raw data are written only once, parameters tables are written only for spectra which have
+        changed since the last save, and metadata are replaced atomically.
+
+        Args:
+            process (Process): process to save.
+
+        Returns:
+            Path: path to the process folder
+        """
+
+        Path(self.path, "tables").mkdir(parents=True, exist_ok=True)
+
+        # generation of the new parameters tables
+        metadata_file = Path(self.path, "process.json")
+        generation, previous, previous_data = 0, {}, {}
+        if metadata_file.is_file():
+            with open(metadata_file, "r") as f:
+                current_generation = json.load(f).get("generation", -1)
+            generation = current_generation + 1
+            previous, previous_data = self._registry(process, current_generation)
+
+        # raw data
+        data = {"ppm_full": self._write_data("ppm_full", process.ppm_axes, previous_data.get("ppm_full", None)),
+                "data_full": self._write_data("data_full", process.data_full, previous_data.get("data_full", None))}
+
+        # collect spectra (the current spectrum is always saved), without rebuilding spectra which have not been accessed since loading
+        entries = [(None, process.current_spectrum)] if process.current_spectrum is not None else []
+        for rowno in process.results.keys():
+            regions = process.results[rowno]
+            for region in regions.keys():
+                record = regions.record(region) if isinstance(regions, LazyRegions) else None
+                entries.append(((rowno, region), regions[region] if record is None else record))
+
+        # spectra which have changed since the last save
+        registry, changed = {}, []
+        for key, obj in entries:
+            marker = self._marker(obj)
+            saved = previous.get(key, None)
+            if saved is not None and self._is_unchanged(marker, saved[0]):
+                registry[key] = saved
+            else:
+                changed.append((key, obj, marker))
+
+        # write parameters tables of changed spectra
+        tables, columns, records = self._build_tables([obj for _, obj, _ in changed])
+        for i, (table, cols) in enumerate(zip(tables, columns)):
+            table["file"] = f"tables/{generation}_{i}.npz"
+            np.savez(Path(self.path, table["file"]), **cols)
+        for (key, _, marker), record in zip(changed, records):
+            if record.get("table", None) is not None:
+                record["table"] = tables[record["table"]]
+            registry[key] = (marker, record)
+
+        # tables of all saved spectra
+        all_tables, table_index = [], {}
+
+        def to_metadata(record):
+            record = dict(record)
+            if record.get("table", None) is not None:
+                table = record["table"]
+                if table["file"] not in table_index:
+                    table_index[table["file"]] = len(all_tables)
+                    all_tables.append(table)
+                record["table"] = table_index[table["file"]]
+            return record
+
+        results = [to_metadata(registry[key][1]) for key, _ in entries if key is not None]
+        current_spectrum = to_metadata(registry.pop(None)[1]) if process.current_spectrum is not None else None
+
+        # write metadata (this makes the new generation current)
+        metadata = {"format": "multinmrfit process", "version": STORE_VERSION, "generation": generation,
+                    "process": {k: getattr(process, k) for k in PROCESS_ATTRIBUTES},
+                    "names": list(process.names),
+                    "tables": all_tables,
+                    "current_spectrum": current_spectrum,
+                    "results": results}
+        tmp_file = Path(self.path, "process_tmp.json")
+        with open(tmp_file, "w") as f:
+            json.dump(metadata, f, default=to_json)
+        os.replace(tmp_file, metadata_file)
+        process._store_registry = (self.path.resolve(), generation, registry, data)
+
+        # remove tables which do not contain saved spectra anymore
+        current = {Path(table["file"]).name for table in all_tables}
+        for table_file in Path(self.path, "tables").glob("*.npz"):
+            if table_file.name not in current:
+                table_file.unlink(missing_ok=True)
+
+        return self.path
+
+    def load(self, process):
+        """Load a process folder in a process object (spectra are rebuilt when they are first accessed).
+
+        Args:
+            process (Process): process to update (usually created without calling Process.__init__).
+
+        Returns:
+            Process: process
+        """
+
+        if not self.is_store(self.path):
+            raise ValueError(f"'{self.path}' is not a process folder.")
+
+        with open(Path(self.path, "process.json"), "r") as f:
+            metadata = json.load(f)
+        if metadata.get("version", None) != STORE_VERSION:
+            raise ValueError(f"Version {metadata.get('version', None)} of process folder '{self.path}' is not supported.")
+
+        # process attributes
+        for k, v in metadata["process"].items():
+            setattr(process, k, v)
+        process.txt_data = None
+        process.names = metadata["names"]
+        process.ppm_full = np.load(Path(self.path, "ppm_full.npy"), mmap_mode="r")
+        process.data_full = np.load(Path(self.path, "data_full.npy"), mmap_mode="r")
+        process.exp_dim = process.data_full.shape
+        process.spectra_list = list(range(0, process.exp_dim[0]))
+        process.models = process.io.get_models()
+        process.results = {}
+        process._index = None
+        process.consolidated_results = None
+        process.journal_file = None
+        process._journal_restored = set()
+
+        # add parameters to records
+        tables = []
+        for table in metadata["tables"]:
+            with np.load(Path(self.path, table["file"])) as columns:
+                tables.append((table, {k: columns[k] for k in columns.files}))
+
+        registry = {}
+
+        def add_params(record, saved_key=None):
+            # saved record, used to detect which spectra have changed when the process is saved again
+            saved = dict(record)
+            if saved.get("table", None) is not None:
+                saved["table"] = tables[saved["table"]][0]
+            if saved_key is not None:
+                registry[saved_key] = (record, saved)
+            if record.get("table", None) is None:
+                record["params"] = None
+                return record
+            table, columns = tables[record.pop("table")]
+            row = record.pop("row")
+            record["params"] = {k: table[k] for k in ["signal_id", "model", "par"]}
+            for k in PARAMS_COLUMNS:
+                if k in columns and columns["has_" + k][row]:
+                    record["params"][k] = columns[k][row]
+            if "shift_allowed" in columns:
+                record["cnstr_wd"] = {"signal_id": table["signal_id"], "model": table["model"], "par": table["par"],
+                                      "shift_allowed": columns["shift_allowed"][row], "relative": columns["relative"][row]}
+            return record
+
+        # spectra
+        def restore(record):
+            sp = process._restore_spectrum(record)
+            # a spectrum rebuilt from its record is unchanged until it is modified
+            key = (record["rowno"], record["region"])
+            entries = process._store_registry[2]
+            if key in entries and entries[key][0] is record:
+                entries[key] = (self._marker(sp), entries[key][1])
+            return sp
+
+        for record in metadata["results"]:
+            rowno = record["rowno"]
+            if rowno not in process.results:
+                process.results[rowno] = LazyRegions({}, restore)
+            dict.__setitem__(process.results[rowno], record["region"], add_params(record, (rowno, record["region"])))
+        if metadata["current_spectrum"] is not None:
+            process.current_spectrum = process._restore_spectrum(add_params(metadata["current_spectrum"]))
+        else:
+            process.current_spectrum = None
+        data = {name: (array, self._file_stamp(Path(self.path, name + ".npy"))) for name, array in [("ppm_full", process.ppm_axes),
+                                                                                                    ("data_full", process.data_full)]}
+        process._store_registry = (self.path.resolve(), metadata["generation"], registry, data)
+
+        return process
@@ -2,6 +2,8 @@ from __future__ import annotations  # Importing annotations from future versions
 
 import numpy as np  # Importing the numpy library for numerical operations
 import pandas as pd  # Importing the pandas library for data manipulation
+from scipy.optimize import approx_fprime  # Finite differences for models without analytical derivatives
+from multinmrfit.base.compiled_model import CompiledModel  # Vectorized mixed gaussian-lorentzian multiplets
 
 # np.trapz deprecated in numpy 2.4.0, use np.trapezoid
 # this code maintains compatibility
@@ -19,6 +21,10 @@ class Model(object):
         _cnstr_wd (pandas.DataFrame): Private variable to store the constraint window.
         _par_idx (None): Private variable to store the parameter index.
         peak_number (None): The number of peaks in the model.
+        multiplet (None): Optional description of the multiplet structure of mixed gaussian-lorentzian models, used
+            to calculate analytical derivatives. Dictionary with keys 'coupling' (chemical shift of each peak relative
+            to x0, as coefficients of each coupling constant), 'w_l' and 'w_g' (relative intensities of the lorentzian
+            and gaussian contributions of each peak).
     """
 
     def __init__(self):
@@ -31,6 +37,7 @@ class Model(object):
         self._cnstr_wd = None
         self._par_idx = None
         self.peak_number = None
+        self.multiplet = None
 
     def set_default_params(self):
         """
@@ -71,17 +78,89 @@ class Model(object):
             if val[0] not in self._params.columns:
                 raise ValueError("key '{}' not found".format(val[0]))
 
-    def integrate(self, params: list, ppm: list):
+    def simulate_batch(self, params, ppm: list):
+        """
+        Simulates the signal for several sets of parameters at once.
+
+        Mixed gaussian-lorentzian models which describe their multiplet structure are simulated by the compiled
+        model (see CompiledModel), other models are simulated by calling simulate() for each set of parameters.
+
+        Args:
+            params (2darray): The parameters for the model, with one set of parameters per row.
+            ppm (list): The ppm values.
+
+        Returns:
+            2darray: The simulated signals, with one signal per row.
+        """
+        params = np.atleast_2d(np.asarray(params, dtype=float))
+        ppm = np.asarray(ppm, dtype=float)
+
+        multiplet = getattr(self, "multiplet", None)
+
+        # loop over parameters sets if the multiplet structure is unknown
+        if multiplet is None:
+            return np.array([np.asarray(self.simulate(p, ppm), dtype=float) for p in params]).reshape(len(params), len(ppm))
+
+        return self._compile().simulate(params, ppm)
+
+    def integrate(self, params: list, ppm: list = None):
         """
         Calculates the integral of the simulated spectra.
 
+        The integral is calculated analytically (from -inf to +inf) for mixed gaussian-lorentzian models which
+        describe their multiplet structure, and numerically over the given ppm values otherwise.
+
         Args:
             params (list): The parameters for the model.
-            ppm (list): The ppm values.
+            ppm (list, optional): The ppm values, only used for numerical integration. Defaults to None.
 
         Returns:
             float: The calculated integral.
         """
+        multiplet = getattr(self, "multiplet", None)
+
+        # analytical integral
+        if multiplet is not None:
+            return np.sum(self._compile().integrals(params))
+
+        if ppm is None:
+            raise ValueError("ppm values are required to integrate model '{}' numerically".format(self.name))
+
         sim_spectra = self.simulate(params, ppm)
         integral = np.trapezoid(y=sim_spectra, x=ppm)
         return integral
+
+    def gradient(self, params: list, ppm: list):
+        """
+        Calculates the partial derivatives of the simulated signal with respect to each parameter.
+
+        Derivatives are calculated analytically for mixed gaussian-lorentzian models which describe
+        their multiplet structure, and are estimated by finite differences otherwise.
+
+        Args:
+            params (list): The parameters for the model.
+            ppm (list): The ppm values.
+
+        Returns:
+            2darray: The partial derivatives, with one row per parameter.
+        """
+        params = np.asarray(params, dtype=float)
+        ppm = np.asarray(ppm, dtype=float)
+
+        # estimate derivatives by finite differences if the multiplet structure is unknown
+        multiplet = getattr(self, "multiplet", None)
+        if multiplet is None:
+            return approx_fprime(params, lambda p: np.asarray(self.simulate(p, ppm), dtype=float)).T
+
+        return self._compile().jacobian(params, ppm).T
+
+    def _compile(self) -> CompiledModel:
+        """
+        Compiles the model alone, with parameters in the order of default_params, so that mixed gaussian-lorentzian
+        multiplets (and their derivatives) are calculated by the same code for a model and for a spectrum.
+
+        Returns:
+            CompiledModel: The compiled model.
+        """
+        n_params = len(self.default_params['par'])
+        return CompiledModel({self.name: self}, n_params, par_idx={self.name: list(range(n_params))})
@@ -22,6 +22,9 @@ class SignalModel(Model):
                                'ub': [10.0, 1.0, 1e15, 0.03, 1.0],
                                'shift_allowed': [0.01, 0.10, 10, 0.3, 10],
                                'relative': [False, True, True, True, False]}
+        self.multiplet = {'coupling': {'J': [0.5, -0.5]},
+                          'w_l': [1.0, 1.0],
+                          'w_g': [1.0, 1.0]}
 
     def pplist2signal(self, peak_list):
 
@@ -19,6 +19,8 @@ class SignalModel(Model):
         peak_number (int): The number of peaks in the signal model.
         default_params (dict): A dictionary containing the default parameters for the signal model.
 
+        multiplet (dict): A dictionary describing the multiplet structure of the signal model.
+
     Methods:
         pplist2signal(peak_list): Set parameters from a peaklist.
         simulate(params, ppm): Simulate a singlet peak from a set of parameters at given chemical shifts.
@@ -29,7 +31,9 @@ class SignalModel(Model):
             set_default_params(): Return the default parameters of the model.
             set_default_cnstr_wd(): Return the default constraints on the parameters of the model.
             set_params(name, val): Set a given parameter of the model.
+            simulate_batch(params, ppm): Simulate the signal for several sets of parameters at once.
             integrate(params, ppm): Integrate the simulated signal over the given chemical shifts.
+            gradient(params, ppm): Calculate the partial derivatives of the signal with respect to each parameter.
 
         Attributes:
             _params (DataFrame): A DataFrame containing the parameters of the model.
@@ -57,6 +61,12 @@ class SignalModel(Model):
                                'ub': [10.0, 1e15, 0.03, 1.0],
                                'shift_allowed': [0.01, 10, 0.3, 10],
                                'relative': [False, True, True, False]}
+        # multiplet structure (used to calculate analytical derivatives): chemical shift of each peak
+        # relative to x0 (as coefficients of the coupling constants), and relative intensities of the
+        # lorentzian and gaussian contributions of each peak
+        self.multiplet = {'coupling': {},
+                          'w_l': [1.0],
+                          'w_g': [1.0]}
 
     def pplist2signal(self, peak_list):
         """
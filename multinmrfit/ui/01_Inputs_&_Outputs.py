@@ -73,7 +73,10 @@ except Exception:
 
 options = load_defaults()
 uploaded_file = st.sidebar.file_uploader("Load a processing file.", type='pkl')
+process_folder = st.sidebar.text_input("Or enter the path to a processing folder (.nmrfit).")
+load_folder = st.sidebar.button("Load processing folder", disabled=not process_folder)
 
+loaded_file = None
 if uploaded_file is not None:
 
     # load process object
@@ -81,6 +84,19 @@ if uploaded_file is not None:
         with uploaded_file as file:
             # process = pd.read_pickle(file)
             process = pickle.load(file)
+    loaded_file = pathlib.Path(process.output_res_path, process.output_res_folder, process.filename + ".pkl")
+
+elif load_folder:
+
+    # load process object (spectra are loaded when they are first accessed)
+    with st.spinner('Loading process folder...'):
+        try:
+            process = Process.load_process_from_file(process_folder)
+            loaded_file = pathlib.Path(process_folder)
+        except Exception as e:
+            st.error(f"Unable to load processing folder '{process_folder}': {e}")
+
+if loaded_file is not None:
 
     # save in session state
     session.object_space["process"] = process
@@ -99,7 +115,7 @@ if uploaded_file is not None:
     )
 
     # save state
-    session.object_space["loaded_file"] = pathlib.Path(process.output_res_path, process.output_res_folder, process.filename + ".pkl")
+    session.object_space["loaded_file"] = loaded_file
 
 reset_process = st.sidebar.button("Reset current process")
 
@@ -124,7 +124,7 @@ else:
 
             st.write("### Peak picking & Clustering")
 
-            val = max(process.current_spectrum.intensity) / \
+            val = float(np.max(process.current_spectrum.intensity)) / \
                 5 if process.current_spectrum.peakpicking_threshold is None else process.current_spectrum.peakpicking_threshold
             peakpicking_threshold = st.number_input(
                 label="Peak picking threshold",
@@ -301,7 +301,7 @@ else:
 
         if save:
             st.success("Region saved")
-            # save as pickle file
+            # save process folder
             with st.spinner('Saving process file...'):
                 process.save_process_to_file()
 
@@ -1,3 +1,4 @@
+import os
 import streamlit as st
 from sess_i.base.main import SessI
 
@@ -14,6 +15,7 @@ def update_checkbox(widget):
     session.register_widgets({widget: not session.widget_space[widget]})
 
 spectra_list = []
+jobs = []
 
 if process is None or len(process.results) == 0:
     
@@ -59,6 +61,19 @@ else:
 
     reprocess = st.checkbox('Reprocess spectra already processed', value=session.widget_space["reprocess"], key="reprocess")
 
+    if not session.widget_space["resume"]:
+        session.register_widgets({"resume": False})
+
+    resume = st.checkbox('Resume interrupted fitting', value=session.widget_space["resume"], key="resume",
+                         help="Restore spectra saved in the checkpoint journal of the output folder during a previous (interrupted) run, "
+                              "and fit only the remaining spectra")
+
+    if not session.widget_space["all_regions"]:
+        session.register_widgets({"all_regions": False})
+
+    all_regions = st.checkbox('Fit all regions of the reference spectrum', value=session.widget_space["all_regions"], key="all_regions",
+                              help="Fit all regions processed in the reference spectrum, in parallel")
+
     if not session.widget_space["use_previous"]:
         session.register_widgets({"use_previous": True})
 
@@ -68,7 +83,48 @@ else:
         session.register_widgets({"use_DE": False})
 
     use_DE = st.checkbox('Refine initial values using Differential evolution', value=session.widget_space["use_DE"], key="use_DE")
-                
+
+    if not session.widget_space["fit_from_same_ref"]:
+        session.register_widgets({"fit_from_same_ref": False})
+
+    col1, col2 = st.columns(2)
+    with col1:
+        fit_from_same_ref = st.checkbox('Fit each spectrum from the reference spectrum (in parallel)', value=session.widget_space["fit_from_same_ref"],
+                                        key="fit_from_same_ref",
+                                        help="Use the reference spectrum (instead of the previous spectrum) to initialize all fits, "
+                                             "which allows fitting spectra in parallel")
+    with col2:
+        n_workers = st.number_input(
+            label="Number of parallel processes",
+            key="n_workers",
+            min_value=1,
+            max_value=os.cpu_count(),
+            value=session.widget_space["n_workers"] if session.widget_space["n_workers"] is not None else 1,
+            help="Spectra above and below the reference spectrum (or all spectra, if fitted from the reference spectrum) are fitted in parallel"
+        )
+        n_segments = st.number_input(
+            label="Number of segments",
+            key="n_segments",
+            min_value=1,
+            value=session.widget_space["n_segments"] if session.widget_space["n_segments"] is not None else 1,
+            disabled=fit_from_same_ref,
+            help="Split long series into segments fitted in parallel, the first spectrum of each segment being fitted from the reference spectrum"
+        )
+
+    if not session.widget_space["global_fit"]:
+        session.register_widgets({"global_fit": False})
+
+    global_fit = st.checkbox('Fit all spectra jointly (global fit)', value=session.widget_space["global_fit"], key="global_fit",
+                             help="Fit all spectra at once, with some parameters (e.g. coupling constants) shared by all spectra")
+    shared_params = []
+    if global_fit:
+        par_names = sorted(set(process.results[reference_spectrum][region].params['par']))
+        shared_params = st.multiselect(
+            label="Parameters shared by all spectra",
+            options=par_names,
+            default=[i for i in (session.widget_space["shared_params"] or ["J", "J1", "J2"]) if i in par_names]
+        )
+
     if session.widget_space["adapt_cnstr_wd"]:
         session.register_widgets({"adapt_cnstr_wd": True})
 
@@ -94,7 +150,14 @@ else:
         "reprocess": reprocess,
         "use_previous": use_previous,
         "adapt_cnstr_wd": adapt_cnstr_wd,
-        "use_DE": use_DE
+        "use_DE": use_DE,
+        "fit_from_same_ref": fit_from_same_ref,
+        "n_workers": n_workers,
+        "n_segments": n_segments,
+        "resume": resume,
+        "all_regions": all_regions,
+        "global_fit": global_fit,
+        "shared_params": shared_params
     })
 
     with st.expander("Reference spectrum", expanded=False):
@@ -108,8 +171,16 @@ else:
     str_list = str(spectra_list) if len(spectra_list) else "None"
     st.info(f"Spectra to process: {str_list}")
 
+    # spectra to fit in each region
+    regions_to_fit = process.regions(reference_spectrum) if all_regions else [region]
+    for reg in regions_to_fit:
+        jobs += [(rowno, reg) for rowno in process.build_spectra_list(spectra_to_process, ref=reference_spectrum, region=reg, reprocess=reprocess)]
+
+    if all_regions:
+        st.info(f"Regions to process: {regions_to_fit}")
 
-if process is not None and len(spectra_list):
+
+if process is not None and len(jobs):
 
     stop = False
     method = "differential_evolution" if use_DE else "L-BFGS-B"
@@ -128,22 +199,38 @@ if process is not None and len(spectra_list):
         progress_text = "Operation in progress. Please wait."
         progress_bar = st.progress(0, text=progress_text)
 
-        list_spectra_upper = [reference_spectrum] + sorted([i for i in spectra_list if i > reference_spectrum])
-        list_spectra_lower = [reference_spectrum] + sorted([i for i in spectra_list if i < reference_spectrum], reverse=True)
-
-        cnstr_wd = process.results[reference_spectrum][region].cnstr_wd if adapt_cnstr_wd else None
-
-        for i, j in enumerate(list_spectra_upper[1:]):
-            percent_complete = (i+1)/(len(list_spectra_upper)+len(list_spectra_lower)-2)
-            progress_text = f"Fitting spectrum {j} (using spectrum {list_spectra_upper[i]} as reference). Please wait."
-            progress_bar.progress(percent_complete, text=progress_text)
-            process.fit_from_ref(rowno=j, region=region, ref=list_spectra_upper[i], update_pars_from_previous=use_previous, update_cnstr_wd=cnstr_wd, method=method)
-
-        for i, j in enumerate(list_spectra_lower[1:]):
-            percent_complete = (i+len(list_spectra_upper))/(len(list_spectra_upper)+len(list_spectra_lower)-2)
-            progress_text = f"Fitting spectrum {j} (using spectrum {list_spectra_lower[i]} as reference). Please wait."
-            progress_bar.progress(percent_complete, text=progress_text)
-            process.fit_from_ref(rowno=j, region=region, ref=list_spectra_lower[i], update_pars_from_previous=use_previous, update_cnstr_wd=cnstr_wd, method=method)
+        cnstr_wd = {reg: process.results[reference_spectrum][reg].cnstr_wd for reg in regions_to_fit} if adapt_cnstr_wd else None
+
+        n_done = []
+
+        def update_progress(rowno, ref):
+            n_done.append(rowno)
+            progress_text = f"Spectrum {rowno} fitted (using spectrum {ref} as reference). Please wait."
+            progress_bar.progress(len(n_done)/len(jobs), text=progress_text)
+
+        # save each fitted spectrum as soon as it has been fitted
+        journal_file = process.open_journal(resume=resume)
+        try:
+            if resume and journal_file.exists():
+                restored = process.load_journal()
+                st.info(f"{len(restored)} spectra restored from checkpoint journal.")
+
+            if global_fit:
+                for i, reg in enumerate(regions_to_fit):
+                    progress_bar.progress(i/len(regions_to_fit), text=f"Global fit of region {reg}. Please wait.")
+                    process.fit_global([rowno for rowno, r in jobs if r == reg], reg, reference_spectrum, shared=shared_params,
+                                       update_pars_from_previous=use_previous, update_cnstr_wd=None if cnstr_wd is None else cnstr_wd[reg], resume=resume)
+                jumps = []
+            else:
+                jumps = process.fit_regions(jobs, ref=reference_spectrum, update_pars_from_previous=use_previous, update_cnstr_wd=cnstr_wd, method=method,
+                                            workers=int(n_workers), callback=update_progress, segments=int(n_segments), chained=not fit_from_same_ref,
+                                            resume=resume)
+        finally:
+            process.close_journal()
+
+        if len(jumps):
+            with st.expander("Parameters at segments boundaries", expanded=False):
+                st.dataframe(jumps, hide_index=True)
 
         progress_bar.empty()
         stop.empty()
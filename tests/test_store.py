@@ -0,0 +1,131 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from multinmrfit.base.io import IoHandler
+from multinmrfit.base.process import Process
+
+
+MODELS = IoHandler.get_models()
+
+SINGLET = {"s": {"model": "singlet", "par": {"x0": {"ini": 2.0, "lb": 1.9, "ub": 2.1}, "intensity": {"ini": 9e5, "lb": 1, "ub": 1e7}}}}
+
+
+def make_process(path, nrows=4):
+    rng = np.random.default_rng(0)
+    ppm = np.linspace(0, 10, 2048)
+    data = {"ppm": ppm}
+    for r in range(nrows):
+        data[str(r+1)] = MODELS["singlet"].simulate([2.0 + 0.001*r, 1e6, 0.01, 0.5], ppm) + rng.normal(0, 1e3, len(ppm))
+    dataset = {"analysis_type": "txt data", "data_path": None, "dataset": None, "expno": None, "procno": None,
+               "output_res_path": str(path), "output_res_folder": "res", "output_filename": "test", "txt_data": pd.DataFrame(data)}
+    return Process(dataset)
+
+
+@pytest.fixture
+def process(tmp_path):
+    process = make_process(tmp_path)
+    process.set_current_spectrum(1, window=(1.8, 2.2))
+    process.current_spectrum.build_model(signals=SINGLET, available_models=process.models, offset={})
+    process.current_spectrum.fit()
+    process.add_region()
+    return process
+
+
+def test_save_load_region_with_offset(process):
+    region = process.current_spectrum.region
+    process.fit_from_ref(2, region, 1)
+
+    loaded = Process.load_process_from_file(process.save_process_to_file())
+
+    assert loaded.current_spectrum.params.shape == process.current_spectrum.params.shape
+    for rowno in [1, 2]:
+        expected, restored = process.results[rowno][region], loaded.results[rowno][region]
+        assert restored.offset
+        pd.testing.assert_frame_equal(expected.params.drop(columns="model"), restored.params.drop(columns="model"), check_dtype=False)
+        np.testing.assert_allclose(expected.fit_results.best_fit, restored.fit_results.best_fit)
+
+
+def test_journal_region_with_offset(process, tmp_path):
+    region = process.current_spectrum.region
+    journal_file = process.open_journal()
+    process.fit_from_ref(2, region, 1)
+
+    resumed = make_process(tmp_path)
+    assert resumed.load_journal(journal_file) == [(2, region)]
+    pd.testing.assert_frame_equal(process.results[2][region].params.drop(columns="model"),
+                                  resumed.results[2][region].params.drop(columns="model"), check_dtype=False)
+
+
+def test_incremental_save(process):
+    region = process.current_spectrum.region
+    for rowno in [2, 3]:
+        process.fit_from_ref(rowno, region, rowno - 1)
+    path = process.save_process_to_file()
+
+    # only the current spectrum and the refitted one are written, not the reference rebuilt from its record
+    loaded = Process.load_process_from_file(path)
+    tables = set(p.name for p in (path / "tables").glob("*.npz"))
+    loaded.fit_from_ref(3, region, 2)
+    loaded.save_process_to_file()
+    new_tables = set(p.name for p in (path / "tables").glob("*.npz")) - tables
+    assert len(new_tables) == 1
+    with np.load(path / "tables" / new_tables.pop()) as table:
+        assert table["opt"].shape[0] == 2
+
+    reloaded = Process.load_process_from_file(path)
+    for rowno in [1, 2, 3]:
+        pd.testing.assert_frame_equal(loaded.results[rowno][region].params.drop(columns="model"),
+                                      reloaded.results[rowno][region].params.drop(columns="model"), check_dtype=False)
+
+
+def test_journal_new_run(process, tmp_path):
+    region = process.current_spectrum.region
+    journal_file = process.open_journal()
+    process.fit_from_ref(2, region, 1)
+
+    # a new run (not resumed) does not restore spectra fitted during the previous one
+    resumed = make_process(tmp_path)
+    assert resumed.open_journal(resume=True) == journal_file
+    assert resumed.load_journal() == [(2, region)]
+    process.open_journal()
+    assert make_process(tmp_path).load_journal() == []
+
+
+def test_incremental_save_edited_in_place(process, monkeypatch):
+    region = process.current_spectrum.region
+    process.fit_from_ref(2, region, 1)
+    sp = process.results[2][region]
+    sp._reset_fit_results()
+    path = process.save_process_to_file()
+
+    # parameters of an unfitted spectrum edited in place are saved
+    sp._set_param("s", "x0", "ini", 2.05)
+    # unchanged raw data are not compared again with the saved data
+    monkeypatch.setattr(np, "array_equal", lambda *args, **kwargs: pytest.fail("raw data compared"))
+    process.save_process_to_file()
+    monkeypatch.undo()
+
+    loaded = Process.load_process_from_file(path)
+    params = loaded.results[2][region].params
+    assert params.loc[(params["signal_id"] == "s") & (params["par"] == "x0"), "ini"].item() == 2.05
+
+
+def test_resume_skips_restored_spectra(process):
+    region = process.current_spectrum.region
+    process.open_journal()
+    process.fit_from_ref(2, region, 1)
+    process.close_journal()
+    # fitted after the journal has been closed, not restored when resuming
+    process.fit_from_ref(3, region, 1)
+    not_restored = process.results[3][region]
+
+    process.open_journal(resume=True)
+    assert process.load_journal() == [(2, region)]
+    restored = process.results[2][region]
+    process.fit_regions([(rowno, region) for rowno in [2, 3, 4]], 1, workers=1, resume=True)
+    process.close_journal()
+
+    assert process.results[2][region] is restored
+    assert process.results[3][region] is not not_restored
+    assert process.results[4][region].fit_results is not None